@@ -1,15 +1,27 @@
 import logging
 import os
-from typing import Dict, Optional, List, Tuple
+from typing import TYPE_CHECKING, Dict, Optional, List, Tuple
 import asyncio
+import heapq
+import html
 import json
+import random
 import re
-from datetime import datetime
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from operator import itemgetter
 
-import gspread
-from google.oauth2.service_account import Credentials
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
+from cachetools import TTLCache
+from openai import APITimeoutError, AsyncOpenAI
+
+# telegram імпортується в main_async: 'import main' з інструментів не тягне за собою PTB
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
 
 # Додаємо fuzzy matching для кращого пошуку
 try:
@@ -20,10 +32,42 @@ except ImportError:
     logger = logging.getLogger(__name__)
     logger.warning("fuzzywuzzy не встановлено. Fuzzy matching буде відключено.")
 
+# Google Sheets - без нього бот працює лише з локальним кешем ресторанів
+try:
+    import gspread
+    from google.auth.transport.requests import Request
+    from google.oauth2.service_account import Credentials
+    GSPREAD_AVAILABLE = True
+except ImportError:
+    GSPREAD_AVAILABLE = False
+    logger = logging.getLogger(__name__)
+    logger.warning("gspread/google-auth не встановлено. Google Sheets буде відключено.")
+
+# orjson - швидший розбір і запис JSON (кеші на диску, облікові дані)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# uvloop - швидший event loop для мережевого I/O (лише Linux/macOS)
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+# Aho-Corasick для пошуку багатьох ключових слів за один прохід
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 # Налаштування логування
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    level=os.getenv('LOG_LEVEL', 'INFO').upper()
 )
 logger = logging.getLogger(__name__)
 
@@ -34,6 +78,89 @@ GOOGLE_CREDENTIALS_JSON = os.getenv('GOOGLE_CREDENTIALS_JSON')
 GOOGLE_SHEET_URL = os.getenv('GOOGLE_SHEET_URL')
 ANALYTICS_SHEET_URL = os.getenv('ANALYTICS_SHEET_URL', GOOGLE_SHEET_URL)
 
+# Без цих змінних бот не запускається; перевіряємо один раз при імпорті,
+# а main() зупиняється ще до створення Application
+REQUIRED_ENV_VARS = ('TELEGRAM_BOT_TOKEN', 'OPENAI_API_KEY', 'GOOGLE_SHEET_URL')
+MISSING_ENV_VARS = [name for name in REQUIRED_ENV_VARS if not os.getenv(name)]
+
+# Кеш готових рекомендацій для однакових запитів
+RECOMMENDATION_CACHE_SIZE = 512
+# Через скільки секунд кешована рекомендація застаріває (щоб однаковий запит не отримував ту саму відповідь вічно)
+RECOMMENDATION_CACHE_TTL = int(os.getenv('RECOMMENDATION_CACHE_TTL', '600'))
+RECOMMENDATION_KEY_MAX_LENGTH = 120
+# Запити з датами, часом чи "сьогодні/завтра" не кешуємо
+EPHEMERAL_REQUEST_RE = re.compile(r'\d|сьогодні|завтра|зараз|вечора|ранку')
+WHITESPACE_RE = re.compile(r'\s+')
+# Розділові знаки не впливають на підбір, тому в ключі кешу їх не враховуємо (апостроф і дефіс - частина слова)
+REQUEST_PUNCTUATION_RE = re.compile(r"[^\w\s'’ʼ-]+")
+NUMBER_RE = re.compile(r'\d+')
+
+# Параметри запиту до OpenAI (однакові для кожної рекомендації)
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '20'))
+OPENAI_COMPLETION_OPTIONS = {"model": OPENAI_MODEL, "max_tokens": 200, "temperature": 0.3, "top_p": 0.9}
+
+# Промпт для вибору двох найкращих варіантів
+OPENAI_SYSTEM_MESSAGE = {"role": "system", "content": "Ти експерт-ресторатор. Аналізуй варіанти та обирай найкращі з обґрунтуванням."}
+RECOMMENDATION_PROMPT_TEMPLATE = """ЗАПИТ КОРИСТУВАЧА: "{user_request}"
+
+ВАЖЛИВО: Всі заклади нижче пройшли ЧОТИРЬОХЕТАПНУ ФІЛЬТРАЦІЮ і максимально підходять під запит.
+
+{restaurants_text}
+
+ЗАВДАННЯ:
+1. Обери 2 НАЙКРАЩІ варіанти (якщо є тільки 1 варіант, то тільки його)
+2. Вкажи який з них є ПРІОРИТЕТНИМ і коротко поясни ЧОМУ
+
+ФОРМАТ ВІДПОВІДІ:
+Варіанти: [номер1, номер2]
+Пріоритет: [номер] - [коротке пояснення причини]
+
+ПРИКЛАД:
+Варіанти: [1, 3]
+Пріоритет: 1 - ідеально підходить за атмосферою та розташуванням
+
+ТВОЯ ВІДПОВІДЬ:"""
+# Опис закладу в промпті; готується при завантаженні даних, на запит додається лише номер варіанту
+PROMPT_CARD_TEMPLATE = """- Назва: {name}
+- Тип: {establishment_type}
+- Атмосфера: {vibe}
+- Призначення: {aim}
+- Кухня: {cuisine}"""
+
+# Скільки користувачів з незавершеною оцінкою тримаємо в пам'яті і як довго (секунди)
+USER_DATA_MAX_USERS = int(os.getenv('USER_DATA_MAX_USERS', '10000'))
+USER_DATA_TTL = int(os.getenv('USER_DATA_TTL', '3600'))
+
+# Скільки відфільтрованих закладів максимум пропонуємо OpenAI на вибір
+MAX_PROMPT_CANDIDATES = int(os.getenv('MAX_PROMPT_CANDIDATES', '8'))
+
+# Локальний кеш даних ресторанів (щоб не завантажувати таблицю при кожному запиті/перезапуску)
+SHEETS_CACHE_FILE = os.getenv('SHEETS_CACHE_FILE', 'restaurants.json')
+SHEETS_CACHE_TTL = int(os.getenv('SHEETS_CACHE_TTL', '3600'))  # секунди
+# Після невдалого оновлення наступна спроба - не раніше ніж через стільки секунд
+SHEETS_REFRESH_RETRY_DELAY = int(os.getenv('SHEETS_REFRESH_RETRY_DELAY', '60'))
+
+# Кеш OAuth-токена Google, щоб не отримувати новий при кожному перезапуску
+GOOGLE_TOKEN_CACHE_FILE = os.getenv('GOOGLE_TOKEN_CACHE_FILE', 'google_token.json')
+GOOGLE_TOKEN_MIN_TTL = 300  # секунди; токен з меншим залишком отримуємо заново
+
+# file_id фото, вже завантажених у Telegram: повторно надсилаємо їх без завантаження з Google Drive
+PHOTO_FILE_ID_CACHE_FILE = os.getenv('PHOTO_FILE_ID_CACHE_FILE', 'photo_file_ids.json')
+
+# Потоки для блокуючих викликів gspread (пул за замовчуванням на Cloud Run - лише кілька потоків)
+SHEETS_THREAD_POOL_SIZE = int(os.getenv('SHEETS_THREAD_POOL_SIZE', '16'))
+
+# Запис в Analytics пакетами з фонової задачі, щоб користувач не чекав на Sheets API
+# (інтервал і розмір пакета визначають, скільки запитів на запис іде в квоту Sheets API)
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '2'))  # секунди
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', '50'))
+ANALYTICS_WRITE_ATTEMPTS = 3
+# Summary перезаписується не частіше ніж раз на стільки секунд (зміни за цей час потрапляють в один запис)
+SUMMARY_UPDATE_COOLDOWN = float(os.getenv('SUMMARY_UPDATE_COOLDOWN', '30'))
+# Скільки секунд /stats показує вже прочитані з Summary значення, не звертаючись до API
+SUMMARY_STATS_CACHE_TTL = float(os.getenv('SUMMARY_STATS_CACHE_TTL', '30'))
+
 # Конфігурація покращеного пошуку
 ENHANCED_SEARCH_CONFIG = {
     'enabled': True,  # Головний перемикач
@@ -42,21 +169,469 @@ ENHANCED_SEARCH_CONFIG = {
     'regex_boundaries': True,  # Використання word boundaries
     'negation_detection': True,  # Детекція заперечень
     'extended_synonyms': True,  # Розширені синоніми
-    'fallback_to_old': True  # Fallback до старої логіки якщо нова не знайде результатів
+    'fallback_to_old': True,  # Fallback до старої логіки якщо нова не знайде результатів
+    'fused_filter': True  # Тип, контекст і меню за один прохід замість трьох фільтрів
+}
+
+
+# Розбір і запис JSON (UTF-8 байти): реалізацію обираємо один раз при імпорті, а не при кожному виклику
+if ORJSON_AVAILABLE:
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        """Компактна серіалізація в JSON стандартним модулем (як у orjson - без пробілів)"""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _compile_keywords(keywords: List[str]) -> re.Pattern:
+    """Компілює список ключових слів в одну regex-альтернацію (пошук підрядка)"""
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+
+# Ключові слова фільтрів (компілюються один раз при імпорті)
+TYPE_KEYWORDS = {
+    'ресторан': {
+        'user_keywords': ['ресторан', 'обід', 'вечеря', 'побачення', 'романтик', 'святкув', 'банкет', 'посідіти', 'поїсти'],
+        'establishment_types': ['ресторан']
+    },
+    'кав\'ярня': {
+        'user_keywords': ['кава', 'капучіно', 'латте', 'еспресо', 'кав\'ярня', 'десерт', 'тірамісу', 'круасан', 'випити кави', 'кофе', 'кафе'],
+        'establishment_types': ['кав\'ярня', 'кафе']
+    },
+    'to-go': {
+        'user_keywords': ['швидко', 'на винос', 'перекус', 'поспішаю', 'to-go', 'takeaway', 'на швидку руку', 'перехопити'],
+        'establishment_types': ['to-go', 'takeaway']
+    },
+    'доставка': {
+        'user_keywords': ['доставка', 'додому', 'замовити', 'привезти', 'delivery', 'не хочу йти'],
+        'establishment_types': ['доставка', 'delivery']
+    }
+}
+
+VIBE_KEYWORDS = {
+    'романтичний': ['романт', 'побачен', 'інтимн', 'затишн', 'свічки', 'романс', 'двох'],
+    'веселий': ['весел', 'живо', 'енергійн', 'гучн', 'драйв', 'динамічн'],
+    'спокійний': ['спокійн', 'тих', 'релакс', 'умиротворен'],
+    'елегантний': ['елегантн', 'розкішн', 'стильн', 'преміум', 'вишукан'],
+    'casual': ['casual', 'невимушен', 'простий', 'домашн'],
+    'затишний': ['затишн', 'домашн', 'теплий', 'комфортн']
+}
+
+AIM_KEYWORDS = {
+    'сімейний': ['сім', 'діт', 'родин', 'батьк', 'мам', 'дитин'],
+    'ділов': ['діл', 'зустріч', 'перегов', 'бізнес', 'робоч', 'офіс', 'партнер'],
+    'друзів': ['друз', 'компан', 'гуртом', 'тусовк', 'молодіжн'],
+    'парі': ['пар', 'двох', 'побачен', 'романт', 'коханою', 'коханого'],
+    'святков': ['святкув', 'день народж', 'ювіле', 'свято', 'торжеств', 'банкет'],
+    'самот': ['сам', 'одн', 'поодин', 'без компанії'],
+    'груп': ['груп', 'багат', 'велик компан', 'корпоратив']
+}
+
+CONTEXT_FILTERS = {
+    'romantic': {
+        'user_keywords': ['романт', 'побачен', 'двох', 'інтимн', 'затишн', 'свічки', 'романс'],
+        'restaurant_keywords': ['інтимн', 'романт', 'для пар', 'камерн', 'приват']
+    },
+    'family': {
+        'user_keywords': ['сім', 'діт', 'родин', 'батьк', 'мам', 'дитин'],
+        'restaurant_keywords': ['сімейн', 'діт', 'родин', 'для всієї сім']
+    },
+    'business': {
+        'user_keywords': ['діл', 'зустріч', 'перегов', 'бізнес', 'робоч', 'офіс'],
+        'restaurant_keywords': ['діл', 'зустріч', 'бізнес', 'перегов', 'офіц']
+    },
+    'friends': {
+        'user_keywords': ['друз', 'компан', 'гуртом', 'весел', 'тусовк'],
+        'restaurant_keywords': ['компан', 'друз', 'молодіжн', 'весел', 'гучн']
+    },
+    'celebration': {
+        'user_keywords': ['святкув', 'день народж', 'ювіле', 'свято', 'торжеств'],
+        'restaurant_keywords': ['святков', 'простор', 'банкет', 'торжеств', 'груп']
+    },
+    'quick': {
+        'user_keywords': ['швидк', 'перекус', 'фаст', 'поспіша', 'на швидку руку'],
+        'restaurant_keywords': ['швидк', 'casual', 'фаст', 'перекус']
+    }
+}
+
+MENU_FOOD_KEYWORDS = {
+    'піца': [' піц', 'pizza', 'піца'],
+    'паста': [' паст', 'спагеті', 'pasta'],
+    'бургер': ['бургер', 'burger', 'гамбургер'],
+    'суші': [' суші', 'sushi', ' рол', 'ролл', 'сашімі'],
+    'салат': [' салат', 'salad'],
+    'хумус': ['хумус', 'hummus'],
+    'фалафель': ['фалафель', 'falafel'],
+    'шаурма': ['шаурм', 'shawarma'],
+    'стейк': ['стейк', 'steak', ' м\'ясо'],
+    'риба': [' риб', 'fish', 'лосось'],
+    'курка': [' курк', 'курчат', 'chicken'],
+    'десерт': ['десерт', 'торт', 'тірамісу', 'морозиво']
+}
+
+
+
+class KeywordScanner:
+    """Знаходить усі категорії, ключові слова яких є в тексті, за один прохід"""
+
+    __slots__ = ('_automaton', '_patterns')
+
+    def __init__(self, keyword_groups: Dict[str, List[str]]):
+        self._automaton = None
+        self._patterns = {}
+
+        if AHOCORASICK_AVAILABLE:
+            # Одне ключове слово може належати кільком категоріям
+            keyword_tags: Dict[str, List[str]] = {}
+            for tag, keywords in keyword_groups.items():
+                for keyword in keywords:
+                    keyword_tags.setdefault(keyword, []).append(tag)
+
+            self._automaton = ahocorasick.Automaton()
+            for keyword, tags in keyword_tags.items():
+                self._automaton.add_word(keyword, tuple(tags))
+            self._automaton.make_automaton()
+        else:
+            self._patterns = {tag: _compile_keywords(keywords) for tag, keywords in keyword_groups.items()}
+
+    def scan(self, text: str) -> set:
+        """Повертає множину категорій, знайдених у тексті"""
+        if self._automaton is not None:
+            return {tag for _, tags in self._automaton.iter(text) for tag in tags}
+        return {tag for tag, pattern in self._patterns.items() if pattern.search(text)}
+
+
+# Сканери текстових полів закладів
+VIBE_SCANNER = KeywordScanner(VIBE_KEYWORDS)
+AIM_SCANNER = KeywordScanner(AIM_KEYWORDS)
+CONTEXT_RESTAURANT_SCANNER = KeywordScanner({name: data['restaurant_keywords'] for name, data in CONTEXT_FILTERS.items()})
+MENU_FOOD_SCANNER = KeywordScanner(MENU_FOOD_KEYWORDS)
+
+# Ключові слова запиту користувача для кожної групи намірів
+INTENT_KEYWORDS = {
+    'type': {name: data['user_keywords'] for name, data in TYPE_KEYWORDS.items()},
+    'vibe': VIBE_KEYWORDS,
+    'aim': AIM_KEYWORDS,
+    'context': {name: data['user_keywords'] for name, data in CONTEXT_FILTERS.items()},
+    'menu': MENU_FOOD_KEYWORDS,
+}
+
+# Один сканер для всіх груп: категорії позначені парою (група, категорія)
+USER_INTENT_SCANNER = KeywordScanner({
+    (group, category): keywords
+    for group, keyword_table in INTENT_KEYWORDS.items()
+    for category, keywords in keyword_table.items()
+})
+
+
+@lru_cache(maxsize=256)
+def _resolve_intents(user_lower: str) -> Dict[str, Tuple[str, ...]]:
+    """Категорії кожної групи, згадані в запиті (у порядку таблиці ключових слів).
+    Запит сканується один раз, повторні запити обслуговуються з кешу."""
+    found = USER_INTENT_SCANNER.scan(user_lower)
+    return {
+        group: tuple(category for category in keyword_table if (group, category) in found)
+        for group, keyword_table in INTENT_KEYWORDS.items()
+    }
+
+@lru_cache(maxsize=1024)
+def _keyword_boundary_re(keyword_lower: str) -> re.Pattern:
+    """Скомпільований пошук ключового слова по межах слів (набір ключових слів фіксований)"""
+    return re.compile(r'\b' + re.escape(keyword_lower) + r'\b')
+
+# Посилання Google Drive та ID файлу в ньому
+GOOGLE_DRIVE_FILE_RE = re.compile(r'/file/d/([a-zA-Z0-9-_]+)')
+GOOGLE_DRIVE_PREFIXES = ('https://drive.google.com/', 'http://drive.google.com/')
+
+
+@lru_cache(maxsize=1024)
+def _direct_drive_url(url: str) -> str:
+    """Пряме посилання на файл Google Drive (посилання з таблиці між завантаженнями не змінюються)"""
+    match = GOOGLE_DRIVE_FILE_RE.search(url)
+    if match:
+        return f"https://drive.google.com/uc?export=view&id={match.group(1)}"
+    
+    logger.warning(f"Не вдалось витягнути ID з Google Drive посилання: {url}")
+    return url
+
+
+# Значення за замовчуванням для відповіді користувачу, якщо колонки немає в таблиці
+RESTAURANT_DEFAULTS = {
+    'name': 'Ресторан',
+    'address': 'Адреса не вказана',
+    'socials': 'Соц-мережі не вказані',
+    'vibe': 'Приємна атмосфера',
+    'aim': 'Для будь-яких подій',
+    'cuisine': 'Смачна кухня',
+    'menu': '',
+    'menu_url': '',
+    'photo': ''
+}
+
+# Колонки, які аналізуємо в нижньому регістрі (підготовлюються один раз при завантаженні)
+LOWER_COLUMNS = ('name', 'type', 'тип закладу', 'vibe', 'aim', 'cuisine', 'menu')
+
+# Словник страв з синонімами (запит користувача і меню закладів)
+DISH_KEYWORDS = {
+    'піца': ['піца', 'піцц', 'pizza', 'піци', 'піззу'],
+    'паста': ['паста', 'спагеті', 'pasta', 'спагетті', 'макарони'],
+    'бургер': ['бургер', 'burger', 'гамбургер', 'чізбургер'],
+    'суші': ['суші', 'sushi', 'роли', 'ролл', 'сашімі'],
+    'салат': ['салат', 'salad'],
+    'хумус': ['хумус', 'hummus'],
+    'фалафель': ['фалафель', 'falafel'],
+    'шаурма': ['шаурм', 'shawarma', 'шаверма'],
+    'стейк': ['стейк', 'steak', 'м\'ясо', 'біфштекс'],
+    'риба': ['риба', 'fish', 'лосось', 'семга', 'тунець', 'форель'],
+    'курка': ['курк', 'курчат', 'chicken', 'куриця'],
+    'десерт': ['десерт', 'торт', 'тірамісу', 'морозиво', 'чізкейк', 'тістечко'],
+    'мідії': ['мідії', 'мидии', 'мідіс', 'молюски', 'мідій'],
+    'креветки': ['креветки', 'креветка', 'shrimp', 'prawns'],
+    'устриці': ['устриці', 'устрица', 'oysters'],
+    'кальмари': ['кальмари', 'кальмари', 'squid'],
+    'равіолі': ['равіолі', 'ravioli', 'равиоли'],
+    'лазанья': ['лазанья', 'lasagna', 'лазаґа'],
+    'різотто': ['різотто', 'risotto', 'ризотто'],
+    'гноки': ['гноки', 'gnocchi', 'нькі'],
+    'тартар': ['тартар', 'tartar'],
+    'карпачо': ['карпачо', 'carpaccio'],
 }
 
+# Шаблони пошуку страв у меню закладів (перевіряються один раз при завантаженні даних):
+# з межами слів і звичайний пошук підрядка, як у ENHANCED_SEARCH_CONFIG['regex_boundaries']
+DISH_BOUNDARY_PATTERNS = {
+    dish: re.compile(r'\b(?:' + '|'.join(re.escape(keyword.lower()) for keyword in keywords) + r')\b')
+    for dish, keywords in DISH_KEYWORDS.items()
+}
+DISH_SUBSTRING_PATTERNS = {
+    dish: _compile_keywords([keyword.lower() for keyword in keywords])
+    for dish, keywords in DISH_KEYWORDS.items()
+}
+
+# Розширені ключові слова для пошуку по всіх колонках
+CONTENT_SEARCH_CRITERIA = {
+    # Напої та специфічні речі
+    'матча': {
+        'keywords': ['матча', 'matcha', 'матчі', 'матчу'],
+        'columns': ['menu', 'aim', 'vibe', 'cuisine', 'name'],
+        'weight': 3.0  # Висока вага для специфічних запитів
+    },
+    'кава': {
+        'keywords': ['кава', 'кофе', 'coffee', 'капучіно', 'латте', 'еспресо'],
+        'columns': ['menu', 'aim', 'cuisine', 'name'],
+        'weight': 2.5
+    },
+
+    # Страви
+    'піца': {
+        'keywords': ['піца', 'піцц', 'pizza'],
+        'columns': ['menu', 'cuisine', 'name'],
+        'weight': 3.0
+    },
+    'суші': {
+        'keywords': ['суші', 'sushi', 'роли', 'ролл', 'сашімі'],
+        'columns': ['menu', 'cuisine', 'name'],
+        'weight': 3.0
+    },
+    'паста': {
+        'keywords': ['паста', 'pasta', 'спагеті'],
+        'columns': ['menu', 'cuisine'],
+        'weight': 2.5
+    },
+    'мідії': {
+        'keywords': ['мідії', 'мідіс', 'мідій', 'молюски'],
+        'columns': ['menu', 'cuisine'],
+        'weight': 3.0
+    },
+
+    # Типи закладів
+    'ресторан': {
+        'keywords': ['ресторан', 'ресторани', 'їдальня'],
+        'columns': ['type', 'тип закладу', 'aim'],
+        'weight': 2.0
+    },
+    'кав\'ярня': {
+        'keywords': ['кав\'ярня', 'кафе', 'coffee shop'],
+        'columns': ['type', 'тип закладу', 'aim'],
+        'weight': 2.0
+    },
+
+    # Атмосфера
+    'романтично': {
+        'keywords': ['романт', 'побачення', 'інтимн', 'затишн'],
+        'columns': ['vibe', 'aim'],
+        'weight': 2.0
+    },
+    'сімейно': {
+        'keywords': ['сім\'я', 'сімейн', 'діти', 'родин'],
+        'columns': ['vibe', 'aim'],
+        'weight': 2.0
+    },
+    'друзі': {
+        'keywords': ['друз', 'компан', 'гурт'],
+        'columns': ['aim', 'vibe'],
+        'weight': 2.0
+    },
+
+    # Призначення
+    'працювати': {
+        'keywords': ['працювати', 'попрацювати', 'робота', 'ноутбук'],
+        'columns': ['aim'],
+        'weight': 2.5
+    },
+    'сніданок': {
+        'keywords': ['сніданок', 'ранок', 'зранку'],
+        'columns': ['aim', 'menu'],
+        'weight': 2.0
+    },
+    'обід': {
+        'keywords': ['обід', 'пообідати'],
+        'columns': ['aim'],
+        'weight': 1.5
+    },
+    'вечеря': {
+        'keywords': ['вечер', 'повечеряти'],
+        'columns': ['aim'],
+        'weight': 1.5
+    },
+
+    # Кухні
+    'італійський': {
+        'keywords': ['італ', 'italian', 'італійськ'],
+        'columns': ['cuisine', 'vibe', 'name'],
+        'weight': 2.0
+    },
+    'японський': {
+        'keywords': ['япон', 'japanese', 'азійськ'],
+        'columns': ['cuisine', 'vibe'],
+        'weight': 2.0
+    },
+    'грузинський': {
+        'keywords': ['грузин', 'georgian'],
+        'columns': ['cuisine', 'vibe', 'name'],
+        'weight': 2.0
+    }
+}
+
+# Покращені категорії з розширеними синонімами
+ENHANCED_TYPE_KEYWORDS = {
+    'ресторан': {
+        'user_keywords': ['ресторан', 'ресторани', 'ресторанчик', 'обід', 'вечеря', 'побачення', 'романтик', 'святкування', 'банкет', 'посідіти', 'поїсти', 'заклад'],
+        'establishment_types': ['ресторан']
+    },
+    'кав\'ярня': {
+        'user_keywords': ['кава', 'капучіно', 'латте', 'еспресо', 'кав\'ярня', 'десерт', 'тірамісу', 'круасан', 'випити кави', 'кофе', 'кафе', 'coffee'],
+        'establishment_types': ['кав\'ярня', 'кафе']
+    },
+    'to-go': {
+        'user_keywords': ['швидко', 'на винос', 'перекус', 'поспішаю', 'to-go', 'takeaway', 'на швидку руку', 'перехопити'],
+        'establishment_types': ['to-go', 'takeaway']
+    },
+    'доставка': {
+        'user_keywords': ['доставка', 'додому', 'замовити', 'привезти', 'delivery', 'не хочу йти', 'вдома'],
+        'establishment_types': ['доставка', 'delivery']
+    }
+}
+
+# Всі відомі типи закладів, за якими фільтруємо
+ESTABLISHMENT_TYPES = [t for data in TYPE_KEYWORDS.values() for t in data['establishment_types']]
+
+# Категорії резервного вибору: (ключові слова запиту, ключові слова в атмосфері та призначенні закладу)
+FALLBACK_KEYWORDS = {
+    'romantic': (('романт', 'побачен', 'інтимн'), ('інтимн', 'романт', 'пар')),
+    'family': (('сім', 'діт', 'родин'), ('сімейн', 'діт', 'родин')),
+    'business': (('діл', 'зустріч', 'бізнес'), ('діл', 'бізнес')),
+    'friends': (('друз', 'компан', 'весел'), ('компан', 'друз', 'молодіжн'))
+}
+FALLBACK_CATEGORY_SCORE = 3
+FALLBACK_USER_SCANNER = KeywordScanner({category: keywords for category, (keywords, _) in FALLBACK_KEYWORDS.items()})
+FALLBACK_RESTAURANT_SCANNER = KeywordScanner({category: keywords for category, (_, keywords) in FALLBACK_KEYWORDS.items()})
+
 # Глобальні змінні
-openai_client = None
-user_states: Dict[int, str] = {}
-user_last_recommendation: Dict[int, str] = {}
-user_rating_data: Dict[int, Dict] = {}
+_rng = random.Random()
+# Асинхронний клієнт OpenAI з пулом з'єднань (таймаут замість asyncio.wait_for)
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, max_retries=0) if OPENAI_API_KEY else None
+# Посилання на фонові задачі, щоб збирач сміття не прибрав їх до завершення
+background_tasks = set()
+# Стан діалогу користувачів: обмежений розмір і автоматичне видалення через USER_DATA_TTL
+user_sessions: Dict[int, "UserSession"] = TTLCache(maxsize=USER_DATA_MAX_USERS, ttl=USER_DATA_TTL)
+
+@dataclass(slots=True)
+class UserSession:
+    """Стан діалогу користувача: остання рекомендація і оцінка, що чекає на пояснення"""
+    state: str = "waiting_request"
+    last_recommendation: str = ""
+    rating: int = 0
 
 class EnhancedRestaurantBot:
+    __slots__ = (
+        'restaurants_data', 'google_sheets_available', 'analytics_sheet', 'summary_sheet', 'gc',
+        '_spreadsheets', '_worksheet_lists', '_restaurants_worksheet', '_source_records', '_restaurants_loaded_at',
+        '_refresh_lock', '_refresh_retry_at',
+        '_category_bits', '_category_masks', '_lower_columns', '_row_of', '_type_labels', '_views', '_prompt_cards',
+        '_data_version', '_rec_cache', '_photo_file_ids',
+        '_analytics_queue', '_analytics_task', '_summary_task', '_summary_pending',
+        '_summary_flush_now', '_last_summary_write', '_summary_rows', '_summary_rows_at',
+        '_stats_text',
+        '_total_requests', '_unique_users', '_rating_sum', '_rating_count', '_summary_counters_loaded',
+        'extended_synonyms', 'negation_words'
+    )
+
     def __init__(self):
         self.restaurants_data = []
         self.google_sheets_available = False
         self.analytics_sheet = None
+        self.summary_sheet = None
         self.gc = None
+        # Відкриті таблиці та списки їхніх аркушів (задачі, щоб одночасні виклики робили один запит)
+        self._spreadsheets: Dict[str, asyncio.Future] = {}
+        self._worksheet_lists: Dict[str, asyncio.Future] = {}
+        self._restaurants_worksheet = None
+        self._source_records = []
+        self._restaurants_loaded_at = 0.0
+        # Одночасні запити після закінчення TTL чекають на одне оновлення, а не запускають кожен своє
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_retry_at = 0.0
+        # Індекс категорій: (фільтр, категорія) -> біт, і маска категорій для кожного рядка
+        self._category_bits: Dict[Tuple[str, str], int] = {}
+        self._category_masks: List[int] = []
+        # Колонки в нижньому регістрі, паралельні до restaurants_data
+        self._lower_columns: Dict[str, List[str]] = {}
+        self._row_of: Dict[int, int] = {}
+        self._type_labels: List[Optional[object]] = []
+        # Готові дані закладів для відповіді (з HTML-карткою), паралельні до restaurants_data
+        self._views: List[Dict] = []
+        # Готові описи закладів для промпту OpenAI, паралельні до restaurants_data
+        self._prompt_cards: List[str] = []
+        # Версія даних змінюється при кожному перезавантаженні таблиці (скидає кеш рекомендацій)
+        self._data_version = 0
+        self._rec_cache: Dict[Tuple[int, str], Dict] = TTLCache(maxsize=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+        # Посилання на фото -> file_id у Telegram
+        self._photo_file_ids: Dict[str, str] = {}
+        # Рядки для Analytics, які фонова задача записує пакетами
+        self._analytics_queue: "asyncio.Queue[List[str]]" = asyncio.Queue()
+        self._analytics_task: Optional[asyncio.Task] = None
+        # Лічильники для Summary: заповнюються один раз з Analytics і далі оновлюються при записі
+        self._total_requests = 0
+        self._unique_users: set = set()
+        self._rating_sum = 0
+        self._rating_count = 0
+        # Поки лічильники не прочитані з Analytics, Summary не перезаписуємо (там справжні підсумки)
+        self._summary_counters_loaded = False
+        # Фонове оновлення Summary: нові запити на оновлення поки воно триває об'єднуються в одне
+        self._summary_task: Optional[asyncio.Task] = None
+        self._summary_pending = False
+        # Встановлюється при зупинці бота: останній запис Summary робимо без очікування
+        self._summary_flush_now = asyncio.Event()
+        self._last_summary_write = float('-inf')
+        # Прочитані для /stats рядки Summary (скидаються після кожного запису Summary)
+        self._summary_rows: Optional[List[List[str]]] = None
+        self._summary_rows_at = 0.0
+        # Готове повідомлення /stats для поточних _summary_rows
+        self._stats_text: Optional[str] = None
         
         # Розширені словники синонімів
         self.extended_synonyms = {
@@ -85,24 +660,22 @@ class EnhancedRestaurantBot:
     
     def _convert_google_drive_url(self, url: str) -> str:
         """Перетворює Google Drive посилання в пряме посилання для зображення"""
-        if not url or 'drive.google.com' not in url:
+        if not url or not url.startswith(GOOGLE_DRIVE_PREFIXES):
             return url
-        
-        match = re.search(r'/file/d/([a-zA-Z0-9-_]+)', url)
-        if match:
-            file_id = match.group(1)
-            direct_url = f"https://drive.google.com/uc?export=view&id={file_id}"
-            logger.info(f"Перетворено Google Drive посилання: {url} → {direct_url}")
-            return direct_url
-        
-        logger.warning(f"Не вдалось витягнути ID з Google Drive посилання: {url}")
-        return url
+        return _direct_drive_url(url)
     
     async def init_google_sheets(self):
         """Ініціалізація підключення до Google Sheets"""
+        # Свіжий локальний кеш дозволяє не завантажувати таблицю ресторанів при старті
+        self._load_restaurants_cache()
+
         if not GOOGLE_CREDENTIALS_JSON or not GOOGLE_SHEET_URL:
             logger.error("Google Sheets credentials не налаштовано")
             return
+        
+        if not GSPREAD_AVAILABLE:
+            logger.error("❌ gspread не встановлено - встановіть gspread: pip install gspread")
+            return
             
         try:
             scope = [
@@ -110,34 +683,203 @@ class EnhancedRestaurantBot:
                 "https://www.googleapis.com/auth/drive.readonly"
             ]
             
-            credentials_dict = json.loads(GOOGLE_CREDENTIALS_JSON)
+            credentials_dict = _json_loads(GOOGLE_CREDENTIALS_JSON)
             creds = Credentials.from_service_account_info(credentials_dict, scopes=scope)
             
-            self.gc = gspread.authorize(creds)
+            if not self._load_google_token(creds):
+                await asyncio.to_thread(creds.refresh, Request())
+                self._save_google_token(creds)
             
-            # Завантажуємо дані ресторанів
-            await self.refresh_restaurants_data()
+            self.gc = await asyncio.to_thread(gspread.authorize, creds)
             
-            # Ініціалізуємо аналітичну таблицю
-            await self.init_analytics_sheet()
+            # Дані ресторанів і аналітичну таблицю завантажуємо паралельно
+            await asyncio.gather(
+                self.refresh_restaurants_data(),
+                self.init_analytics_sheet()
+            )
                 
         except Exception as e:
             logger.error(f"Детальна помилка Google Sheets: {type(e).__name__}: {str(e)}")
     
+    def _load_google_token(self, creds: 'Credentials') -> bool:
+        """Підставляє збережений токен доступу, якщо він ще дійсний.
+        Після закінчення терміну дії credentials оновлять токен самі."""
+        try:
+            with open(GOOGLE_TOKEN_CACHE_FILE, 'rb') as token_file:
+                cached = _json_loads(token_file.read())
+            expiry = datetime.fromisoformat(cached['expiry'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        # google-auth зберігає expiry як наївний час UTC - для порівняння додаємо зону
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        
+        if cached.get('client_email') != creds.service_account_email:
+            return False
+        
+        remaining = (expiry - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= GOOGLE_TOKEN_MIN_TTL:
+            logger.info(f"🔑 Збережений токен Google спливає ({remaining:.0f} с), отримую новий")
+            return False
+        
+        creds.token = cached['token']
+        creds.expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+        logger.info(f"🔑 Використовую збережений токен Google (дійсний ще {remaining:.0f} с)")
+        return True
+    
+    def _save_google_token(self, creds: 'Credentials'):
+        """Збереження токена доступу Google для наступних запусків"""
+        if not creds.token or not creds.expiry:
+            return
+        
+        tmp_path = f"{GOOGLE_TOKEN_CACHE_FILE}.tmp"
+        try:
+            # Токен доступу - секрет, тож файл доступний лише власнику
+            token_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(token_fd, 'wb') as token_file:
+                token_file.write(_json_dumps({
+                    'client_email': creds.service_account_email,
+                    'token': creds.token,
+                    'expiry': creds.expiry.isoformat()
+                }))
+            os.replace(tmp_path, GOOGLE_TOKEN_CACHE_FILE)
+        except OSError as e:
+            logger.warning(f"⚠️ Не вдалося зберегти токен Google: {e}")
+    
+    def load_photo_file_ids(self):
+        """Завантаження file_id фото, збережених під час попередніх запусків"""
+        try:
+            with open(PHOTO_FILE_ID_CACHE_FILE, 'rb') as cache_file:
+                file_ids = _json_loads(cache_file.read())
+        except (OSError, ValueError):
+            return
+        
+        if isinstance(file_ids, dict):
+            self._photo_file_ids.update(file_ids)
+            logger.info(f"🖼 Завантажено {len(file_ids)} file_id фото з локального кешу")
+    
+    def _save_photo_file_ids(self):
+        """Атомарний запис file_id фото у локальний кеш"""
+        tmp_path = f"{PHOTO_FILE_ID_CACHE_FILE}.tmp"
+        try:
+            with open(tmp_path, 'wb') as cache_file:
+                cache_file.write(_json_dumps(self._photo_file_ids))
+            os.replace(tmp_path, PHOTO_FILE_ID_CACHE_FILE)
+        except OSError as e:
+            logger.warning(f"⚠️ Не вдалося зберегти file_id фото: {e}")
+    
+    def photo_source(self, photo_url: str) -> str:
+        """file_id фото, якщо воно вже надсилалось, інакше саме посилання"""
+        return self._photo_file_ids.get(photo_url, photo_url)
+    
+    def remember_photo(self, photo_url: str, message):
+        """Запам'ятовує file_id щойно надісланого фото"""
+        if not message.photo:
+            return
+        file_id = message.photo[-1].file_id
+        if self._photo_file_ids.get(photo_url) != file_id:
+            self._photo_file_ids[photo_url] = file_id
+            self._save_photo_file_ids()
+    
+    def forget_photo(self, photo_url: str):
+        """Прибирає file_id, який Telegram більше не приймає"""
+        if self._photo_file_ids.pop(photo_url, None) is not None:
+            self._save_photo_file_ids()
+    
+    def _load_restaurants_cache(self) -> bool:
+        """Завантаження даних ресторанів з локального кешу, якщо він ще не застарів"""
+        try:
+            cache_age = time.time() - os.path.getmtime(SHEETS_CACHE_FILE)
+        except OSError:
+            return False
+        
+        if cache_age >= SHEETS_CACHE_TTL:
+            logger.info(f"🗄 Локальний кеш ресторанів застарів ({cache_age:.0f} с)")
+            return False
+        
+        try:
+            with open(SHEETS_CACHE_FILE, 'rb') as cache_file:
+                records = _json_loads(cache_file.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Не вдалося прочитати кеш ресторанів: {e}")
+            return False
+        
+        if not records:
+            return False
+        
+        self._set_restaurants(records)
+        self._restaurants_loaded_at = time.time() - cache_age
+        self.google_sheets_available = True
+        logger.info(f"🗄 Завантажено {len(records)} закладів з локального кешу ({cache_age:.0f} с)")
+        return True
+    
+    def _save_restaurants_cache(self, records: List[Dict]):
+        """Атомарний запис даних ресторанів у локальний кеш"""
+        tmp_path = f"{SHEETS_CACHE_FILE}.tmp"
+        try:
+            with open(tmp_path, 'wb') as cache_file:
+                cache_file.write(_json_dumps(records))
+            os.replace(tmp_path, SHEETS_CACHE_FILE)
+        except OSError as e:
+            logger.warning(f"⚠️ Не вдалося зберегти кеш ресторанів: {e}")
+    
+    def _touch_restaurants_cache(self, records: List[Dict]):
+        """Позначає локальний кеш свіжим без повторної серіалізації даних"""
+        try:
+            os.utime(SHEETS_CACHE_FILE)
+        except OSError:
+            self._save_restaurants_cache(records)
+    
+    def _restaurants_fresh(self) -> bool:
+        """Чи є завантажені дані, молодші за SHEETS_CACHE_TTL"""
+        return bool(self.restaurants_data) and time.time() - self._restaurants_loaded_at < SHEETS_CACHE_TTL
+    
     async def refresh_restaurants_data(self):
-        """Оновлення даних ресторанів з Google таблиці"""
+        """Оновлення даних ресторанів з Google таблиці (не частіше за SHEETS_CACHE_TTL)"""
+        if self._restaurants_fresh():
+            return True
+        if time.time() < self._refresh_retry_at:
+            return False
+        
+        async with self._refresh_lock:
+            # Поки чекали, дані могла оновити (або не змогти оновити) інша задача
+            if self._restaurants_fresh():
+                return True
+            if time.time() < self._refresh_retry_at:
+                return False
+            
+            refreshed = await self._fetch_restaurants_data()
+            if not refreshed:
+                self._refresh_retry_at = time.time() + SHEETS_REFRESH_RETRY_DELAY
+            return refreshed
+    
+    async def _fetch_restaurants_data(self) -> bool:
+        """Завантажує дані ресторанів з Google таблиці"""
         if not self.gc:
             logger.warning("Google Sheets клієнт не ініціалізовано")
             return False
             
         try:
-            google_sheet = self.gc.open_by_url(GOOGLE_SHEET_URL)
-            worksheet = google_sheet.sheet1
+            # Блокуючі виклики gspread виконуємо в окремому потоці, щоб не зупиняти event loop.
+            # Аркуш відкриваємо лише раз - далі оновлення коштує один запит значень
+            if self._restaurants_worksheet is None:
+                self._restaurants_worksheet = (await self._list_worksheets(GOOGLE_SHEET_URL))[0]
             
-            records = worksheet.get_all_records()
+            # Сирі значення і словники з рядка заголовків: get_all_records додатково перетворює
+            # кожну клітинку на число (і губить нулі на початку, наприклад у телефонах)
+            rows = await asyncio.to_thread(self._restaurants_worksheet.get_all_values)
+            headers = rows[0] if rows else []
+            records = [dict(zip(headers, row)) for row in rows[1:]]
             
             if records:
-                self.restaurants_data = records
+                # Запис файлу кешу (серіалізація всієї таблиці) теж виконуємо поза event loop
+                if records != self._source_records:
+                    self._set_restaurants(records)
+                    await asyncio.to_thread(self._save_restaurants_cache, records)
+                else:
+                    # Дані не змінились - достатньо оновити час модифікації кешу
+                    await asyncio.to_thread(self._touch_restaurants_cache, records)
+                self._restaurants_loaded_at = time.time()
                 self.google_sheets_available = True
                 logger.info(f"🔄 Оновлено дані ресторанів: {len(self.restaurants_data)} закладів")
                 return True
@@ -147,171 +889,260 @@ class EnhancedRestaurantBot:
                 
         except Exception as e:
             logger.error(f"Помилка оновлення даних ресторанів: {e}")
+            # Наступна спроба відкриє таблицю заново
+            self._spreadsheets.pop(GOOGLE_SHEET_URL, None)
+            self._worksheet_lists.pop(GOOGLE_SHEET_URL, None)
+            self._restaurants_worksheet = None
             return False
     
+    def _set_restaurants(self, records: List[Dict]):
+        """Зберігає дані ресторанів (з усіма колонками) і перебудовує індекс категорій"""
+        self._source_records = records
+        self._data_version += 1
+        self._rec_cache.clear()
+        
+        restaurants = []
+        converted_photos = 0
+        for record in records:
+            # Значення за замовчуванням (RESTAURANT_DEFAULTS) підставляються лише у відповідь користувачу,
+            # а пошук і промпт працюють із тим, що є в таблиці
+            restaurant = dict(record)
+            # Посилання на фото перетворюємо один раз при завантаженні, а не при кожній відповіді
+            photo = restaurant.get('photo', '')
+            photo_url = self._convert_google_drive_url(photo)
+            if photo_url != photo:
+                restaurant['photo'] = photo_url
+                converted_photos += 1
+            restaurants.append(restaurant)
+        
+        if converted_photos:
+            logger.info(f"🖼 Перетворено {converted_photos} посилань Google Drive на прямі посилання")
+        
+        self.restaurants_data = restaurants
+        self._row_of = {id(restaurant): row for row, restaurant in enumerate(restaurants)}
+        self._lower_columns = {
+            column: [str(restaurant.get(column, '')).casefold() for restaurant in restaurants]
+            for column in LOWER_COLUMNS
+        }
+        # Тип закладу з колонки 'тип закладу', а якщо її немає - з 'type' (None, якщо немає обох)
+        self._type_labels = [restaurant.get('тип закладу', restaurant.get('type')) for restaurant in restaurants]
+        self._lower_columns['establishment_type'] = [
+            str('' if label is None else label).casefold().strip()
+            for label in self._type_labels
+        ]
+        self._views = [self._build_restaurant_view(row, restaurant) for row, restaurant in enumerate(restaurants)]
+        # Для колонок, яких немає в таблиці, OpenAI бачить "не вказано", а не вигадані описи
+        self._prompt_cards = [
+            PROMPT_CARD_TEMPLATE.format(
+                name=restaurant.get('name', 'Без назви'),
+                establishment_type='Не вказано' if label is None else label,
+                vibe=restaurant.get('vibe', 'Не описана'),
+                aim=restaurant.get('aim', 'Не вказано'),
+                cuisine=restaurant.get('cuisine', 'Не вказана')
+            )
+            for restaurant, label in zip(restaurants, self._type_labels)
+        ]
+        self._build_restaurant_index()
+
+    def _build_restaurant_index(self):
+        """Один раз після завантаження визначає, до яких категорій фільтрів належить кожен заклад.
+        Кожна категорія отримує свій біт, тож перевірка під час запиту - це одне побітове І."""
+        category_bits: Dict[Tuple[str, str], int] = {}
+        category_masks: List[int] = []
+
+        def bit(group: str, category: str) -> int:
+            key = (group, category)
+            if key not in category_bits:
+                category_bits[key] = 1 << len(category_bits)
+            return category_bits[key]
+
+        columns = self._lower_columns
+        if ENHANCED_SEARCH_CONFIG['regex_boundaries']:
+            dish_patterns = DISH_BOUNDARY_PATTERNS
+        else:
+            dish_patterns = DISH_SUBSTRING_PATTERNS
+        for row in range(len(self.restaurants_data)):
+            mask = 0
+            establishment_type = columns['establishment_type'][row]
+            restaurant_vibe = columns['vibe'][row]
+            restaurant_aim = columns['aim'][row]
+            menu_text = columns['menu'][row]
+            restaurant_text = f"{restaurant_vibe} {restaurant_aim} {columns['cuisine'][row]} {columns['name'][row]}"
+
+            for detected_type in ESTABLISHMENT_TYPES:
+                if detected_type in establishment_type or establishment_type in detected_type:
+                    mask |= bit('type', detected_type)
+            for vibe_type in VIBE_SCANNER.scan(restaurant_vibe):
+                mask |= bit('vibe', vibe_type)
+            for aim_type in AIM_SCANNER.scan(restaurant_aim):
+                mask |= bit('aim', aim_type)
+            for context in CONTEXT_RESTAURANT_SCANNER.scan(restaurant_text):
+                mask |= bit('context', context)
+            for dish in MENU_FOOD_SCANNER.scan(menu_text):
+                mask |= bit('menu', dish)
+            for dish, pattern in dish_patterns.items():
+                if pattern.search(menu_text):
+                    mask |= bit('dish', dish)
+            for criterion_name, criterion_data in CONTENT_SEARCH_CRITERIA.items():
+                keywords = criterion_data['keywords']
+                if any(keyword in columns[column][row] for column in criterion_data['columns'] for keyword in keywords):
+                    mask |= bit('content', criterion_name)
+            vibe_aim_text = f"{restaurant_vibe} {restaurant_aim}"
+            for category in FALLBACK_RESTAURANT_SCANNER.scan(vibe_aim_text):
+                mask |= bit('fallback', category)
+            category_masks.append(mask)
+
+        self._category_bits = category_bits
+        self._category_masks = category_masks
+        logger.info(f"🗂 Побудовано індекс категорій: {len(category_bits)} категорій для {len(self.restaurants_data)} закладів")
+
+    def _category_mask(self, group: str, categories) -> int:
+        """Маска з бітів категорій запиту (категорій, яких немає в жодного закладу, не враховуємо)"""
+        mask = 0
+        for category in categories:
+            mask |= self._category_bits.get((group, category), 0)
+        return mask
+
+    def _restaurant_mask(self, restaurant: Dict) -> int:
+        """Маска категорій закладу за попередньо побудованим індексом"""
+        return self._category_masks[self._row_of[id(restaurant)]]
+
+    async def warm_up_openai(self):
+        """Встановлює з'єднання з OpenAI до першого запиту користувача"""
+        if openai_client is None:
+            return
+        
+        try:
+            await openai_client.models.list()
+            logger.info("✅ З'єднання з OpenAI встановлено")
+        except Exception as e:
+            logger.warning(f"⚠️ Не вдалося прогріти з'єднання з OpenAI: {e}")
+    
+    @staticmethod
+    async def _shared_request(cache: Dict[str, asyncio.Future], url: str, make_request):
+        """Один запит до API на таблицю: одночасні й повторні виклики чекають на той самий результат.
+        Невдалий запит не кешується, тож наступний виклик спробує знову."""
+        task = cache.get(url)
+        if task is None:
+            task = cache[url] = asyncio.ensure_future(make_request())
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if cache.get(url) is task:
+                del cache[url]
+            raise
+    
+    async def _open_spreadsheet(self, url: str):
+        """Відкриває таблицю один раз; повторні виклики не роблять запитів до API"""
+        return await self._shared_request(
+            self._spreadsheets, url, lambda: asyncio.to_thread(self.gc.open_by_url, url)
+        )
+    
+    async def _list_worksheets(self, url: str):
+        """Аркуші таблиці за один запит метаданих. Дані ресторанів і Analytics за замовчуванням
+        в одній таблиці, тож при старті обидва отримують аркуші з одного запиту"""
+        async def fetch():
+            spreadsheet = await self._open_spreadsheet(url)
+            return await asyncio.to_thread(spreadsheet.worksheets)
+        return await self._shared_request(self._worksheet_lists, url, fetch)
+    
     async def init_analytics_sheet(self):
         """Ініціалізація аналітичної таблиці"""
         try:
-            analytics_sheet = self.gc.open_by_url(ANALYTICS_SHEET_URL)
+            analytics_sheet = await self._open_spreadsheet(ANALYTICS_SHEET_URL)
             logger.info(f"📊 Відкрито таблицю для analytics: {ANALYTICS_SHEET_URL}")
             
-            existing_sheets = [worksheet.title for worksheet in analytics_sheet.worksheets()]
-            logger.info(f"📋 Існуючі аркуші: {existing_sheets}")
+            # Один запит метаданих замість окремого пошуку кожного аркуша
+            worksheets = {worksheet.title: worksheet for worksheet in await self._list_worksheets(ANALYTICS_SHEET_URL)}
+            logger.info(f"📋 Існуючі аркуші: {list(worksheets)}")
             
-            try:
-                self.analytics_sheet = analytics_sheet.worksheet("Analytics")
+            self.analytics_sheet = worksheets.get("Analytics")
+            headers = []
+            if self.analytics_sheet:
                 logger.info("✅ Знайдено існуючий лист Analytics")
                 
                 try:
-                    headers = self.analytics_sheet.row_values(1)
+                    # Читання заголовків заодно перевіряє доступ до аркуша
+                    headers = await asyncio.to_thread(self.analytics_sheet.row_values, 1)
+                    logger.info(f"📋 Заголовки Analytics: {headers}")
                     if "Rating Explanation" not in headers:
                         logger.info("🔧 Додаю колонку Rating Explanation до існуючого аркуша")
                         if "Rating" in headers:
                             rating_index = headers.index("Rating") + 1
-                            self.analytics_sheet.insert_cols([[]], col=rating_index + 2)
-                            self.analytics_sheet.update_cell(1, rating_index + 2, "Rating Explanation")
+                            # Вставляємо колонку одразу із заголовком - один запит замість двох
+                            await asyncio.to_thread(self.analytics_sheet.insert_cols, [["Rating Explanation"]], col=rating_index + 2)
                         else:
                             next_col = len(headers) + 1
-                            self.analytics_sheet.update_cell(1, next_col, "Rating Explanation")
+                            await asyncio.to_thread(self.analytics_sheet.update_cell, 1, next_col, "Rating Explanation")
                 except Exception as header_error:
                     logger.warning(f"⚠️ Помилка перевірки заголовків: {header_error}")
                     
-            except gspread.WorksheetNotFound:
+            else:
                 logger.info("📄 Аркуш Analytics не знайдено, створюю новий...")
                 
-                self.analytics_sheet = analytics_sheet.add_worksheet(title="Analytics", rows="1000", cols="12")
+                self.analytics_sheet = await asyncio.to_thread(analytics_sheet.add_worksheet, title="Analytics", rows="1000", cols="12")
                 logger.info("✅ Створено новий лист Analytics")
                 
                 headers = [
                     "Timestamp", "User ID", "User Request", "Restaurant Name", 
                     "Rating", "Rating Explanation", "Date", "Time"
                 ]
-                self.analytics_sheet.append_row(headers)
+                await asyncio.to_thread(self.analytics_sheet.append_row, headers)
                 logger.info("✅ Додано заголовки до Analytics")
             
-            try:
-                self.summary_sheet = analytics_sheet.worksheet("Summary")
+            self.summary_sheet = worksheets.get("Summary")
+            if self.summary_sheet:
                 logger.info("✅ Знайдено існуючий лист Summary")
-            except gspread.WorksheetNotFound:
-                self.summary_sheet = analytics_sheet.add_worksheet(title="Summary", rows="100", cols="5")
+            else:
+                self.summary_sheet = await asyncio.to_thread(analytics_sheet.add_worksheet, title="Summary", rows="100", cols="5")
                 logger.info("✅ Створено новий лист Summary")
                 
-                summary_data = [
-                    ["Метрика", "Значення", "Останнє оновлення"],
-                    ["Загальна кількість запитів", "0", datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
-                    ["Кількість унікальних користувачів", "0", datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
-                    ["Середня оцінка відповідності", "0", datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
-                    ["Кількість оцінок", "0", datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
-                ]
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                summary_data = [["Метрика", "Значення", "Останнє оновлення"]]
+                summary_data.extend([label, "0", now] for label in SUMMARY_METRIC_LABELS)
                 
-                for row in summary_data:
-                    self.summary_sheet.append_row(row)
+                # Всі початкові рядки записуємо одним запитом
+                await asyncio.to_thread(
+                    self.summary_sheet.update,
+                    range_name=f"A1:C{len(summary_data)}",
+                    values=summary_data,
+                    value_input_option="USER_ENTERED"
+                )
                     
                 logger.info("✅ Додано початкові дані до Summary")
             
-            logger.info("🧪 Тестую можливість запису до Analytics...")
-            test_success = await self.test_analytics_write()
-            if test_success:
-                logger.info("✅ Тест запису до Analytics успішний!")
-            else:
-                logger.error("❌ Тест запису до Analytics не вдався!")
+            await self._load_summary_counters(headers)
+            if self._analytics_task is None:
+                self._analytics_task = asyncio.create_task(self._analytics_flush_loop())
+            logger.info("✅ Analytics доступний!")
                 
         except Exception as e:
             logger.error(f"Помилка ініціалізації Analytics: {e}")
             self.analytics_sheet = None
-    
-    async def test_analytics_write(self):
-        """Тест запису до Analytics аркуша"""
-        if not self.analytics_sheet:
-            return False
-        
-        try:
-            headers = self.analytics_sheet.row_values(1)
-            logger.info(f"📋 Заголовки Analytics: {headers}")
-            
-            test_row = [
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "TEST_USER",
-                "TEST_REQUEST", 
-                "TEST_RESTAURANT",
-                "5",
-                "Test explanation",
-                datetime.now().strftime("%Y-%m-%d"),
-                datetime.now().strftime("%H:%M:%S")
-            ]
-            
-            self.analytics_sheet.append_row(test_row)
-            logger.info("✅ Тестовий запис додано успішно")
-            
-            all_values = self.analytics_sheet.get_all_values()
-            if len(all_values) > 1:
-                last_row = len(all_values)
-                if "TEST_USER" in all_values[-1]:
-                    self.analytics_sheet.delete_rows(last_row)
-                    logger.info("✅ Тестовий запис видалено")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Помилка тесту запису: {e}")
-            return False
 
-    def _check_dish_availability(self, user_request: str) -> Tuple[bool, List[str]]:
+    def _check_dish_availability(self, user_lower: str) -> Tuple[bool, List[str]]:
         """
         Перевіряє, чи є потрібна страва в меню хоча б одного ресторану
         
         Returns:
             (є_страва_в_меню, список_знайдених_страв)
         """
-        user_lower = user_request.lower()
-        logger.info(f"🔍 Перевіряю наявність конкретних страв в запиті: '{user_request}'")
+        logger.info(f"🔍 Перевіряю наявність конкретних страв в запиті: '{user_lower}'")
         
-        # Розширений словник страв з синонімами
-        food_keywords = {
-            'піца': ['піца', 'піцц', 'pizza', 'піци', 'піззу'],
-            'паста': ['паста', 'спагеті', 'pasta', 'спагетті', 'макарони'],
-            'бургер': ['бургер', 'burger', 'гамбургер', 'чізбургер'],
-            'суші': ['суші', 'sushi', 'роли', 'ролл', 'сашімі'],
-            'салат': ['салат', 'salad'],
-            'хумус': ['хумус', 'hummus'],
-            'фалафель': ['фалафель', 'falafel'],
-            'шаурма': ['шаурм', 'shawarma', 'шаверма'],
-            'стейк': ['стейк', 'steak', 'м\'ясо', 'біфштекс'],
-            'риба': ['риба', 'fish', 'лосось', 'семга', 'тунець', 'форель'],
-            'курка': ['курк', 'курчат', 'chicken', 'куриця'],
-            'десерт': ['десерт', 'торт', 'тірамісу', 'морозиво', 'чізкейк', 'тістечко'],
-            'мідії': ['мідії', 'мидии', 'мідіс', 'молюски', 'мідій'],
-            'креветки': ['креветки', 'креветка', 'shrimp', 'prawns'],
-            'устриці': ['устриці', 'устрица', 'oysters'],
-            'кальмари': ['кальмари', 'кальмари', 'squid'],
-            'равіолі': ['равіолі', 'ravioli', 'равиоли'],
-            'лазанья': ['лазанья', 'lasagna', 'лазаґа'],
-            'різотто': ['різотто', 'risotto', 'ризотто'],
-            'гноки': ['гноки', 'gnocchi', 'нькі'],
-            'тартар': ['тартар', 'tartar'],
-            'карпачо': ['карпачо', 'carpaccio'],
-        }
+        # Знаходимо які страви згадав користувач: один скомпільований пошук на страву замість перебору ключових слів
+        if ENHANCED_SEARCH_CONFIG['enabled'] and ENHANCED_SEARCH_CONFIG['regex_boundaries']:
+            # Використовуємо word boundaries для точнішого пошуку
+            dish_patterns, match_method = DISH_BOUNDARY_PATTERNS, 'regex'
+        else:
+            # Простий пошук підрядка
+            dish_patterns, match_method = DISH_SUBSTRING_PATTERNS, 'substring'
         
-        # Знаходимо які страви згадав користувач
         requested_dishes = []
-        for dish, keywords in food_keywords.items():
-            match_found = False
-            
-            # Перевіряємо різними способами
-            for keyword in keywords:
-                if ENHANCED_SEARCH_CONFIG['enabled'] and ENHANCED_SEARCH_CONFIG['regex_boundaries']:
-                    # Використовуємо word boundaries для точнішого пошуку
-                    pattern = r'\b' + re.escape(keyword.lower()) + r'\b'
-                    if re.search(pattern, user_lower):
-                        match_found = True
-                        logger.info(f"🎯 Знайдено страву '{dish}' через keyword '{keyword}' (regex)")
-                        break
-                else:
-                    # Простий пошук підрядка
-                    if keyword.lower() in user_lower:
-                        match_found = True
-                        logger.info(f"🎯 Знайдено страву '{dish}' через keyword '{keyword}' (substring)")
-                        break
+        for dish, keywords in DISH_KEYWORDS.items():
+            match = dish_patterns[dish].search(user_lower)
+            match_found = match is not None
+            if match_found:
+                logger.info(f"🎯 Знайдено страву '{dish}' через keyword '{match.group()}' ({match_method})")
             
             # Fuzzy matching як додатковий метод
             if not match_found and ENHANCED_SEARCH_CONFIG['fuzzy_matching'] and FUZZY_AVAILABLE:
@@ -341,30 +1172,13 @@ class EnhancedRestaurantBot:
         dishes_found_in_restaurants = []
         
         for dish in requested_dishes:
-            found_in_any_restaurant = False
-            dish_keywords = food_keywords[dish]
-            
-            for restaurant in self.restaurants_data:
-                menu_text = restaurant.get('menu', '').lower()
-                
-                # Перевіряємо кожен синонім страви в меню ресторану
-                for keyword in dish_keywords:
-                    if ENHANCED_SEARCH_CONFIG['regex_boundaries']:
-                        pattern = r'\b' + re.escape(keyword.lower()) + r'\b'
-                        if re.search(pattern, menu_text):
-                            found_in_any_restaurant = True
-                            logger.info(f"✅ Страву '{dish}' знайдено в меню '{restaurant.get('name', 'Невідомий')}'")
-                            break
-                    else:
-                        if keyword.lower() in menu_text:
-                            found_in_any_restaurant = True
-                            logger.info(f"✅ Страву '{dish}' знайдено в меню '{restaurant.get('name', 'Невідомий')}'")
-                            break
-                
-                if found_in_any_restaurant:
-                    break
+            # Страви в меню закладів визначені в індексі категорій при завантаженні
+            dish_bit = self._category_mask('dish', (dish,))
+            found_row = next((row for row, mask in enumerate(self._category_masks) if mask & dish_bit), None)
+            found_in_any_restaurant = found_row is not None
             
             if found_in_any_restaurant:
+                logger.info(f"✅ Страву '{dish}' знайдено в меню '{self.restaurants_data[found_row]['name']}'")
                 dishes_found_in_restaurants.append(dish)
             else:
                 logger.info(f"❌ Страву '{dish}' НЕ знайдено в жодному меню")
@@ -408,8 +1222,7 @@ class EnhancedRestaurantBot:
             if keyword_lower in user_lower:
                 if ENHANCED_SEARCH_CONFIG['regex_boundaries']:
                     # Перевіряємо word boundaries щоб уникнути false positives
-                    pattern = r'\b' + re.escape(keyword_lower) + r'\b'
-                    if re.search(pattern, user_lower):
+                    if _keyword_boundary_re(keyword_lower).search(user_lower):
                         confidence = 1.0
                         any_match = True
                         found_keywords.append(keyword)
@@ -493,152 +1306,34 @@ class EnhancedRestaurantBot:
         
         return len(found_synonyms) > 0, max_confidence, found_synonyms
 
-    def _comprehensive_content_analysis(self, user_request: str) -> Tuple[bool, List[Dict], str]:
+    def _comprehensive_content_analysis(self, user_lower: str) -> Tuple[bool, List[Dict], str]:
         """
         Комплексний аналіз запиту користувача по всіх колонках таблиці
         
         Returns:
             (знайдено_релевантні_заклади, список_закладів_з_оцінками, пояснення)
         """
-        user_lower = user_request.lower()
-        logger.info(f"🔎 КОМПЛЕКСНИЙ АНАЛІЗ: '{user_request}'")
-        
-        # Розширені ключові слова для пошуку по всіх колонках
-        search_criteria = {
-            # Напої та специфічні речі
-            'матча': {
-                'keywords': ['матча', 'matcha', 'матчі', 'матчу'],
-                'columns': ['menu', 'aim', 'vibe', 'cuisine', 'name'],
-                'weight': 3.0  # Висока вага для специфічних запитів
-            },
-            'кава': {
-                'keywords': ['кава', 'кофе', 'coffee', 'капучіно', 'латте', 'еспресо'],
-                'columns': ['menu', 'aim', 'cuisine', 'name'],
-                'weight': 2.5
-            },
-            
-            # Страви
-            'піца': {
-                'keywords': ['піца', 'піцц', 'pizza'],
-                'columns': ['menu', 'cuisine', 'name'],
-                'weight': 3.0
-            },
-            'суші': {
-                'keywords': ['суші', 'sushi', 'роли', 'ролл', 'сашімі'],
-                'columns': ['menu', 'cuisine', 'name'],
-                'weight': 3.0
-            },
-            'паста': {
-                'keywords': ['паста', 'pasta', 'спагеті'],
-                'columns': ['menu', 'cuisine'],
-                'weight': 2.5
-            },
-            'мідії': {
-                'keywords': ['мідії', 'мідіс', 'мідій', 'молюски'],
-                'columns': ['menu', 'cuisine'],
-                'weight': 3.0
-            },
-            
-            # Типи закладів
-            'ресторан': {
-                'keywords': ['ресторан', 'ресторани', 'їдальня'],
-                'columns': ['type', 'тип закладу', 'aim'],
-                'weight': 2.0
-            },
-            'кав\'ярня': {
-                'keywords': ['кав\'ярня', 'кафе', 'coffee shop'],
-                'columns': ['type', 'тип закладу', 'aim'],
-                'weight': 2.0
-            },
-            
-            # Атмосфера
-            'романтично': {
-                'keywords': ['романт', 'побачення', 'інтимн', 'затишн'],
-                'columns': ['vibe', 'aim'],
-                'weight': 2.0
-            },
-            'сімейно': {
-                'keywords': ['сім\'я', 'сімейн', 'діти', 'родин'],
-                'columns': ['vibe', 'aim'],
-                'weight': 2.0
-            },
-            'друзі': {
-                'keywords': ['друз', 'компан', 'гурт'],
-                'columns': ['aim', 'vibe'],
-                'weight': 2.0
-            },
-            
-            # Призначення
-            'працювати': {
-                'keywords': ['працювати', 'попрацювати', 'робота', 'ноутбук'],
-                'columns': ['aim'],
-                'weight': 2.5
-            },
-            'сніданок': {
-                'keywords': ['сніданок', 'ранок', 'зранку'],
-                'columns': ['aim', 'menu'],
-                'weight': 2.0
-            },
-            'обід': {
-                'keywords': ['обід', 'пообідати'],
-                'columns': ['aim'],
-                'weight': 1.5
-            },
-            'вечеря': {
-                'keywords': ['вечер', 'повечеряти'],
-                'columns': ['aim'],
-                'weight': 1.5
-            },
-            
-            # Кухні
-            'італійський': {
-                'keywords': ['італ', 'italian', 'італійськ'],
-                'columns': ['cuisine', 'vibe', 'name'],
-                'weight': 2.0
-            },
-            'японський': {
-                'keywords': ['япон', 'japanese', 'азійськ'],
-                'columns': ['cuisine', 'vibe'],
-                'weight': 2.0
-            },
-            'грузинський': {
-                'keywords': ['грузин', 'georgian'],
-                'columns': ['cuisine', 'vibe', 'name'],
-                'weight': 2.0
-            }
-        }
+        logger.info(f"🔎 КОМПЛЕКСНИЙ АНАЛІЗ: '{user_lower}'")
+        
+        # Критерії, ключові слова яких є в запиті користувача (визначаємо один раз, а не для кожного закладу)
+        user_criteria = [
+            (criterion_name, self._category_mask('content', (criterion_name,)), criterion_data['weight'])
+            for criterion_name, criterion_data in CONTENT_SEARCH_CRITERIA.items()
+            if any(keyword in user_lower for keyword in criterion_data['keywords'])
+        ]
         
-        # Аналізуємо кожен заклад
+        # Аналізуємо кожен заклад; збіги закладів з критеріями вже є в індексі категорій
         restaurant_scores = []
+        debug_log = logger.isEnabledFor(logging.DEBUG)
         
-        for restaurant in self.restaurants_data:
+        for restaurant, restaurant_mask in zip(self.restaurants_data, self._category_masks) if user_criteria else ():
             total_score = 0.0
             matched_criteria = []
             
-            # Перевіряємо кожен критерій
-            for criterion_name, criterion_data in search_criteria.items():
-                keywords = criterion_data['keywords']
-                columns = criterion_data['columns'] 
-                weight = criterion_data['weight']
-                
-                # Перевіряємо чи є ключові слова в запиті користувача
-                user_has_criterion = any(keyword in user_lower for keyword in keywords)
-                
-                if user_has_criterion:
-                    # Шукаємо в відповідних колонках ресторану
-                    restaurant_has_criterion = False
-                    
-                    for column in columns:
-                        column_text = str(restaurant.get(column, '')).lower()
-                        
-                        if any(keyword in column_text for keyword in keywords):
-                            restaurant_has_criterion = True
-                            logger.info(f"   ✅ {restaurant.get('name', '')} має '{criterion_name}' в колонці '{column}'")
-                            break
-                    
-                    if restaurant_has_criterion:
-                        total_score += weight
-                        matched_criteria.append(criterion_name)
+            for criterion_name, criterion_bit, weight in user_criteria:
+                if restaurant_mask & criterion_bit:
+                    total_score += weight
+                    matched_criteria.append(criterion_name)
             
             if total_score > 0:
                 restaurant_scores.append({
@@ -646,7 +1341,8 @@ class EnhancedRestaurantBot:
                     'score': total_score,
                     'criteria': matched_criteria
                 })
-                logger.info(f"🎯 {restaurant.get('name', '')}: оцінка {total_score:.1f} за критеріями {matched_criteria}")
+                if debug_log:
+                    logger.debug("🎯 %s: оцінка %.1f за критеріями %s", restaurant.get('name', ''), total_score, matched_criteria)
         
         # Сортуємо за оцінкою
         restaurant_scores.sort(key=lambda x: x['score'], reverse=True)
@@ -664,70 +1360,15 @@ class EnhancedRestaurantBot:
             logger.info("🤔 КОМПЛЕКСНИЙ АНАЛІЗ: не знайдено специфічних критеріїв")
             return False, [], "не знайдено специфічних критеріїв"
     
-    def _get_dish_keywords(self, dish: str) -> List[str]:
-        """Повертає список ключових слів для конкретної страви"""
-        food_keywords = {
-            'піца': ['піца', 'піцц', 'pizza', 'піци', 'піззу'],
-            'паста': ['паста', 'спагеті', 'pasta', 'спагетті', 'макарони'],
-            'бургер': ['бургер', 'burger', 'гамбургер', 'чізбургер'],
-            'суші': ['суші', 'sushi', 'роли', 'ролл', 'сашімі'],
-            'салат': ['салат', 'salad'],
-            'хумус': ['хумус', 'hummus'],
-            'фалафель': ['фалафель', 'falafel'],
-            'шаурма': ['шаурм', 'shawarma', 'шаверма'],
-            'стейк': ['стейк', 'steak', 'м\'ясо', 'біфштекс'],
-            'риба': ['риба', 'fish', 'лосось', 'семга', 'тунець', 'форель'],
-            'курка': ['курк', 'курчат', 'chicken', 'куриця'],
-            'десерт': ['десерт', 'торт', 'тірамісу', 'морозиво', 'чізкейк', 'тістечко'],
-            'мідії': ['мідії', 'мидии', 'мідіс', 'молюски', 'мідій'],
-            'креветки': ['креветки', 'креветка', 'shrimp', 'prawns'],
-            'устриці': ['устриці', 'устрица', 'oysters'],
-            'кальмари': ['кальмари', 'кальмари', 'squid'],
-            'равіолі': ['равіолі', 'ravioli', 'равиоли'],
-            'лазанья': ['лазанья', 'lasagna', 'лазаґа'],
-            'різотто': ['різотто', 'risotto', 'ризотто'],
-            'гноки': ['гноки', 'gnocchi', 'нькі'],
-            'тартар': ['тартар', 'tartar'],
-            'карпачо': ['карпачо', 'carpaccio'],
-        }
-        
-        return food_keywords.get(dish, [dish])
-
-    def _enhanced_filter_by_establishment_type(self, user_request: str, restaurant_list):
-        """Покращена фільтрація за типом закладу"""
-        user_lower = user_request.lower()
-        logger.info(f"🏢 ENHANCED: Аналізую запит '{user_request}'")
-        
-        if not restaurant_list:
-            return restaurant_list
-        
-        # Покращені категорії з розширеними синонімами
-        enhanced_type_keywords = {
-            'ресторан': {
-                'user_keywords': ['ресторан', 'ресторани', 'ресторанчик', 'обід', 'вечеря', 'побачення', 'романтик', 'святкування', 'банкет', 'посідіти', 'поїсти', 'заклад'],
-                'establishment_types': ['ресторан']
-            },
-            'кав\'ярня': {
-                'user_keywords': ['кава', 'капучіно', 'латте', 'еспресо', 'кав\'ярня', 'десерт', 'тірамісу', 'круасан', 'випити кави', 'кофе', 'кафе', 'coffee'],
-                'establishment_types': ['кав\'ярня', 'кафе']
-            },
-            'to-go': {
-                'user_keywords': ['швидко', 'на винос', 'перекус', 'поспішаю', 'to-go', 'takeaway', 'на швидку руку', 'перехопити'],
-                'establishment_types': ['to-go', 'takeaway']
-            },
-            'доставка': {
-                'user_keywords': ['доставка', 'додому', 'замовити', 'привезти', 'delivery', 'не хочу йти', 'вдома'],
-                'establishment_types': ['доставка', 'delivery']
-            }
-        }
-        
+    def _detect_enhanced_types(self, user_lower: str) -> List[str]:
+        """Типи закладів, які шукає користувач (покращений пошук)"""
         # Знаходимо відповідний тип закладу з покращеним пошуком
         detected_types = []
         detection_details = []
         
-        for establishment_type, keywords in enhanced_type_keywords.items():
+        for establishment_type, keywords in ENHANCED_TYPE_KEYWORDS.items():
             match_found, confidence, found_words = self._enhanced_keyword_match(
-                user_request, 
+                user_lower, 
                 keywords['user_keywords'], 
                 f"establishment_type_{establishment_type}"
             )
@@ -741,6 +1382,17 @@ class EnhancedRestaurantBot:
                 })
                 logger.info(f"🎯 ENHANCED: Виявлено тип '{establishment_type}' з впевненістю {confidence:.2f}")
         
+        return detected_types
+    
+    def _enhanced_filter_by_establishment_type(self, user_lower: str, intents: Dict[str, Tuple[str, ...]], restaurant_list):
+        """Покращена фільтрація за типом закладу"""
+        logger.info(f"🏢 ENHANCED: Аналізую запит '{user_lower}'")
+        
+        if not restaurant_list:
+            return restaurant_list
+        
+        detected_types = self._detect_enhanced_types(user_lower)
+        
         # Якщо тип не визначено, не фільтруємо
         if not detected_types:
             logger.info("🏢 ENHANCED: Тип закладу не визначено, повертаю всі заклади")
@@ -750,26 +1402,21 @@ class EnhancedRestaurantBot:
         
         # Фільтруємо за типом закладу
         filtered_restaurants = []
+        debug_log = logger.isEnabledFor(logging.DEBUG)
+        type_mask = self._category_mask('type', detected_types)
         for restaurant in restaurant_list:
-            establishment_type = restaurant.get('тип закладу', restaurant.get('type', '')).lower().strip()
-            
             # Перевіряємо збіг типу закладу
-            type_match = any(
-                detected_type.lower().strip() in establishment_type or 
-                establishment_type in detected_type.lower().strip() 
-                for detected_type in detected_types
-            )
+            type_match = bool(self._restaurant_mask(restaurant) & type_mask)
             
             if type_match:
                 filtered_restaurants.append(restaurant)
-                logger.info(f"   ✅ ENHANCED: {restaurant.get('name', '')}: тип '{establishment_type}' ПІДХОДИТЬ")
-            else:
-                logger.info(f"   ❌ ENHANCED: {restaurant.get('name', '')}: тип '{establishment_type}' НЕ ПІДХОДИТЬ")
+            if debug_log:
+                logger.debug("   %s ENHANCED: %s: тип %s", "✅" if type_match else "❌", restaurant.get('name', ''), "ПІДХОДИТЬ" if type_match else "НЕ ПІДХОДИТЬ")
         
         # Fallback до старої логіки якщо нова не знайшла результатів
         if not filtered_restaurants and ENHANCED_SEARCH_CONFIG['fallback_to_old']:
             logger.warning("⚠️ ENHANCED: Нова логіка не знайшла результатів, fallback до старої")
-            return self._filter_by_establishment_type(user_request, restaurant_list)
+            return self._filter_by_establishment_type(user_lower, intents, restaurant_list)
         
         if filtered_restaurants:
             logger.info(f"🏢 ENHANCED: УСПІХ! Відфільтровано {len(filtered_restaurants)} закладів відповідного типу з {len(restaurant_list)}")
@@ -780,38 +1427,15 @@ class EnhancedRestaurantBot:
         return filtered_restaurants
     
     # Старі методи залишаємо для fallback
-    def _filter_by_establishment_type(self, user_request: str, restaurant_list):
+    def _filter_by_establishment_type(self, user_lower: str, intents: Dict[str, Tuple[str, ...]], restaurant_list):
         """СТАРА ЛОГІКА: Фільтрує ресторани за типом закладу"""
-        user_lower = user_request.lower()
-        logger.info(f"🏢 OLD: Аналізую запит '{user_request}'")
-        
-        # Визначаємо тип закладу з запиту користувача
-        type_keywords = {
-            'ресторан': {
-                'user_keywords': ['ресторан', 'обід', 'вечеря', 'побачення', 'романтик', 'святкув', 'банкет', 'посідіти', 'поїсти'],
-                'establishment_types': ['ресторан']
-            },
-            'кав\'ярня': {
-                'user_keywords': ['кава', 'капучіно', 'латте', 'еспресо', 'кав\'ярня', 'десерт', 'тірамісу', 'круасан', 'випити кави', 'кофе', 'кафе'],
-                'establishment_types': ['кав\'ярня', 'кафе']
-            },
-            'to-go': {
-                'user_keywords': ['швидко', 'на винос', 'перекус', 'поспішаю', 'to-go', 'takeaway', 'на швидку руку', 'перехопити'],
-                'establishment_types': ['to-go', 'takeaway']
-            },
-            'доставка': {
-                'user_keywords': ['доставка', 'додому', 'замовити', 'привезти', 'delivery', 'не хочу йти'],
-                'establishment_types': ['доставка', 'delivery']
-            }
-        }
-        
+        logger.info(f"🏢 OLD: Аналізую запит '{user_lower}'")
+
         # Знаходимо відповідний тип закладу
         detected_types = []
-        for establishment_type, keywords in type_keywords.items():
-            user_match = any(keyword in user_lower for keyword in keywords['user_keywords'])
-            if user_match:
-                detected_types.extend(keywords['establishment_types'])
-                logger.info(f"🎯 OLD: Виявлено збіг '{establishment_type}'")
+        for establishment_type in intents['type']:
+            detected_types.extend(TYPE_KEYWORDS[establishment_type]['establishment_types'])
+            logger.info(f"🎯 OLD: Виявлено збіг '{establishment_type}'")
         
         # Якщо тип не визначено, не фільтруємо
         if not detected_types:
@@ -820,37 +1444,21 @@ class EnhancedRestaurantBot:
         
         # Фільтруємо за типом закладу
         filtered_restaurants = []
+        type_mask = self._category_mask('type', detected_types)
         for restaurant in restaurant_list:
-            establishment_type = restaurant.get('тип закладу', restaurant.get('type', '')).lower().strip()
-            type_match = any(detected_type.lower().strip() in establishment_type or establishment_type in detected_type.lower().strip() 
-                           for detected_type in detected_types)
+            type_match = bool(self._restaurant_mask(restaurant) & type_mask)
             
             if type_match:
                 filtered_restaurants.append(restaurant)
         
         return filtered_restaurants if filtered_restaurants else restaurant_list
 
-    def _filter_by_vibe(self, user_request: str, restaurant_list):
+    def _filter_by_vibe(self, user_lower: str, intents: Dict[str, Tuple[str, ...]], restaurant_list):
         """Фільтрує ресторани за атмосферою (vibe)"""
-        user_lower = user_request.lower()
-        logger.info(f"✨ Аналізую запит на атмосферу: '{user_request}'")
-        
-        # Ключові слова для атмосфери
-        vibe_keywords = {
-            'романтичний': ['романт', 'побачен', 'інтимн', 'затишн', 'свічки', 'романс', 'двох'],
-            'веселий': ['весел', 'живо', 'енергійн', 'гучн', 'драйв', 'динамічн'],
-            'спокійний': ['спокійн', 'тих', 'релакс', 'умиротворен'],
-            'елегантний': ['елегантн', 'розкішн', 'стильн', 'преміум', 'вишукан'],
-            'casual': ['casual', 'невимушен', 'простий', 'домашн'],
-            'затишний': ['затишн', 'домашн', 'теплий', 'комфортн']
-        }
+        logger.info(f"✨ Аналізую запит на атмосферу: '{user_lower}'")
         
         # Знаходимо відповідну атмосферу
-        detected_vibes = []
-        for vibe_type, keywords in vibe_keywords.items():
-            user_match = any(keyword in user_lower for keyword in keywords)
-            if user_match:
-                detected_vibes.append(vibe_type)
+        detected_vibes = intents['vibe']
         
         if not detected_vibes:
             logger.info("✨ Атмосфера не визначена, повертаю всі заклади")
@@ -860,20 +1468,16 @@ class EnhancedRestaurantBot:
         
         # Фільтруємо за атмосферою
         filtered_restaurants = []
+        debug_log = logger.isEnabledFor(logging.DEBUG)
+        vibe_mask = self._category_mask('vibe', detected_vibes)
         for restaurant in restaurant_list:
-            restaurant_vibe = restaurant.get('vibe', '').lower()
-            
             # Перевіряємо збіг атмосфери
-            vibe_match = any(
-                any(keyword in restaurant_vibe for keyword in vibe_keywords[detected_vibe])
-                for detected_vibe in detected_vibes
-            )
+            vibe_match = bool(self._restaurant_mask(restaurant) & vibe_mask)
             
             if vibe_match:
                 filtered_restaurants.append(restaurant)
-                logger.info(f"   ✅ {restaurant.get('name', '')}: атмосфера '{restaurant_vibe}' підходить")
-            else:
-                logger.info(f"   ❌ {restaurant.get('name', '')}: атмосфера '{restaurant_vibe}' не підходить")
+            if debug_log:
+                logger.debug("   %s %s: атмосфера '%s' %s", "✅" if vibe_match else "❌", restaurant.get('name', ''), restaurant.get('vibe', ''), "підходить" if vibe_match else "не підходить")
         
         if filtered_restaurants:
             logger.info(f"✨ Відфільтровано {len(filtered_restaurants)} закладів відповідної атмосфери з {len(restaurant_list)}")
@@ -882,28 +1486,12 @@ class EnhancedRestaurantBot:
             logger.warning("⚠️ Жоден заклад не підходить за атмосферою, повертаю всі")
             return restaurant_list
 
-    def _filter_by_aim(self, user_request: str, restaurant_list):
+    def _filter_by_aim(self, user_lower: str, intents: Dict[str, Tuple[str, ...]], restaurant_list):
         """Фільтрує ресторани за призначенням (aim)"""
-        user_lower = user_request.lower()
-        logger.info(f"🎯 Аналізую запит на призначення: '{user_request}'")
-        
-        # Ключові слова для призначення
-        aim_keywords = {
-            'сімейний': ['сім', 'діт', 'родин', 'батьк', 'мам', 'дитин'],
-            'ділов': ['діл', 'зустріч', 'перегов', 'бізнес', 'робоч', 'офіс', 'партнер'],
-            'друзів': ['друз', 'компан', 'гуртом', 'тусовк', 'молодіжн'],
-            'парі': ['пар', 'двох', 'побачен', 'романт', 'коханою', 'коханого'],
-            'святков': ['святкув', 'день народж', 'ювіле', 'свято', 'торжеств', 'банкет'],
-            'самот': ['сам', 'одн', 'поодин', 'без компанії'],
-            'груп': ['груп', 'багат', 'велик компан', 'корпоратив']
-        }
+        logger.info(f"🎯 Аналізую запит на призначення: '{user_lower}'")
         
         # Знаходимо відповідне призначення
-        detected_aims = []
-        for aim_type, keywords in aim_keywords.items():
-            user_match = any(keyword in user_lower for keyword in keywords)
-            if user_match:
-                detected_aims.append(aim_type)
+        detected_aims = intents['aim']
         
         if not detected_aims:
             logger.info("🎯 Призначення не визначено, повертаю всі заклади")
@@ -913,20 +1501,16 @@ class EnhancedRestaurantBot:
         
         # Фільтруємо за призначенням
         filtered_restaurants = []
+        debug_log = logger.isEnabledFor(logging.DEBUG)
+        aim_mask = self._category_mask('aim', detected_aims)
         for restaurant in restaurant_list:
-            restaurant_aim = restaurant.get('aim', '').lower()
-            
             # Перевіряємо збіг призначення
-            aim_match = any(
-                any(keyword in restaurant_aim for keyword in aim_keywords[detected_aim])
-                for detected_aim in detected_aims
-            )
+            aim_match = bool(self._restaurant_mask(restaurant) & aim_mask)
             
             if aim_match:
                 filtered_restaurants.append(restaurant)
-                logger.info(f"   ✅ {restaurant.get('name', '')}: призначення '{restaurant_aim}' підходить")
-            else:
-                logger.info(f"   ❌ {restaurant.get('name', '')}: призначення '{restaurant_aim}' не підходить")
+            if debug_log:
+                logger.debug("   %s %s: призначення '%s' %s", "✅" if aim_match else "❌", restaurant.get('name', ''), restaurant.get('aim', ''), "підходить" if aim_match else "не підходить")
         
         if filtered_restaurants:
             logger.info(f"🎯 Відфільтровано {len(filtered_restaurants)} закладів відповідного призначення з {len(restaurant_list)}")
@@ -935,43 +1519,11 @@ class EnhancedRestaurantBot:
             logger.warning("⚠️ Жоден заклад не підходить за призначенням, повертаю всі")
             return restaurant_list
 
-    def _filter_by_context(self, user_request: str, restaurant_list):
+    def _filter_by_context(self, user_lower: str, intents: Dict[str, Tuple[str, ...]], restaurant_list):
         """Фільтрує ресторани за контекстом запиту"""
-        user_lower = user_request.lower()
-        logger.info(f"🎯 Аналізую запит на контекст: '{user_request}'")
-        
-        context_filters = {
-            'romantic': {
-                'user_keywords': ['романт', 'побачен', 'двох', 'інтимн', 'затишн', 'свічки', 'романс'],
-                'restaurant_keywords': ['інтимн', 'романт', 'для пар', 'камерн', 'приват']
-            },
-            'family': {
-                'user_keywords': ['сім', 'діт', 'родин', 'батьк', 'мам', 'дитин'],
-                'restaurant_keywords': ['сімейн', 'діт', 'родин', 'для всієї сім']
-            },
-            'business': {
-                'user_keywords': ['діл', 'зустріч', 'перегов', 'бізнес', 'робоч', 'офіс'],
-                'restaurant_keywords': ['діл', 'зустріч', 'бізнес', 'перегов', 'офіц']
-            },
-            'friends': {
-                'user_keywords': ['друз', 'компан', 'гуртом', 'весел', 'тусовк'],
-                'restaurant_keywords': ['компан', 'друз', 'молодіжн', 'весел', 'гучн']
-            },
-            'celebration': {
-                'user_keywords': ['святкув', 'день народж', 'ювіле', 'свято', 'торжеств'],
-                'restaurant_keywords': ['святков', 'простор', 'банкет', 'торжеств', 'груп']
-            },
-            'quick': {
-                'user_keywords': ['швидк', 'перекус', 'фаст', 'поспіша', 'на швидку руку'],
-                'restaurant_keywords': ['швидк', 'casual', 'фаст', 'перекус']
-            }
-        }
+        logger.info(f"🎯 Аналізую запит на контекст: '{user_lower}'")
         
-        detected_contexts = []
-        for context, keywords in context_filters.items():
-            user_match = any(keyword in user_lower for keyword in keywords['user_keywords'])
-            if user_match:
-                detected_contexts.append(context)
+        detected_contexts = intents['context']
         
         if not detected_contexts:
             logger.info("🔍 Контекст не визначено, повертаю всі ресторани")
@@ -980,23 +1532,19 @@ class EnhancedRestaurantBot:
         logger.info(f"🎯 Виявлено контекст(и): {detected_contexts}")
         
         filtered_restaurants = []
+        debug_log = logger.isEnabledFor(logging.DEBUG)
+        context_bits = [(context, self._category_mask('context', (context,))) for context in detected_contexts]
         for restaurant in restaurant_list:
-            restaurant_text = f"{restaurant.get('vibe', '')} {restaurant.get('aim', '')} {restaurant.get('cuisine', '')} {restaurant.get('name', '')}".lower()
-            
-            restaurant_score = 0
-            matched_contexts = []
-            
-            for context in detected_contexts:
-                context_keywords = context_filters[context]['restaurant_keywords']
-                if any(keyword in restaurant_text for keyword in context_keywords):
-                    restaurant_score += 1
-                    matched_contexts.append(context)
+            restaurant_mask = self._restaurant_mask(restaurant)
+            matched_contexts = [context for context, context_bit in context_bits if restaurant_mask & context_bit]
+            restaurant_score = len(matched_contexts)
             
             if restaurant_score > 0:
                 filtered_restaurants.append((restaurant_score, restaurant, matched_contexts))
-                logger.info(f"   ✅ {restaurant.get('name', '')}: збіг по {matched_contexts}")
-            else:
-                logger.info(f"   ❌ {restaurant.get('name', '')}: не підходить за контекстом")
+                if debug_log:
+                    logger.debug("   ✅ %s: збіг по %s", restaurant.get('name', ''), matched_contexts)
+            elif debug_log:
+                logger.debug("   ❌ %s: не підходить за контекстом", restaurant.get('name', ''))
         
         if filtered_restaurants:
             filtered_restaurants.sort(key=lambda x: x[0], reverse=True)
@@ -1007,49 +1555,26 @@ class EnhancedRestaurantBot:
             logger.warning("⚠️ Жоден ресторан не підходить за контекстом, повертаю всі")
             return restaurant_list
 
-    def _filter_by_menu(self, user_request: str, restaurant_list):
+    def _filter_by_menu(self, user_lower: str, intents: Dict[str, Tuple[str, ...]], restaurant_list):
         """Фільтрує ресторани по меню"""
-        user_lower = user_request.lower()
-        
-        food_keywords = {
-            'піца': [' піц', 'pizza', 'піца'],
-            'паста': [' паст', 'спагеті', 'pasta'],
-            'бургер': ['бургер', 'burger', 'гамбургер'],
-            'суші': [' суші', 'sushi', ' рол', 'ролл', 'сашімі'],
-            'салат': [' салат', 'salad'],
-            'хумус': ['хумус', 'hummus'],
-            'фалафель': ['фалафель', 'falafel'],
-            'шаурма': ['шаурм', 'shawarma'],
-            'стейк': ['стейк', 'steak', ' м\'ясо'],
-            'риба': [' риб', 'fish', 'лосось'],
-            'курка': [' курк', 'курчат', 'chicken'],
-            'десерт': ['десерт', 'торт', 'тірамісу', 'морозиво']
-        }
-        
-        requested_dishes = []
-        for dish, keywords in food_keywords.items():
-            if any(keyword in user_lower for keyword in keywords):
-                requested_dishes.append(dish)
+
+        requested_dishes = intents['menu']
         
         if requested_dishes:
-            filtered_restaurants = []
             logger.info(f"🍽 Користувач шукає конкретні страви: {requested_dishes}")
             
-            for restaurant in restaurant_list:
-                menu_text = restaurant.get('menu', '').lower()
-                has_requested_dish = False
-                
-                for dish in requested_dishes:
-                    dish_keywords = food_keywords[dish]
-                    if any(keyword in menu_text for keyword in dish_keywords):
-                        has_requested_dish = True
-                        logger.info(f"   ✅ {restaurant.get('name', '')} має {dish}")
-                        break
-                
-                if has_requested_dish:
-                    filtered_restaurants.append(restaurant)
-                else:
-                    logger.info(f"   ❌ {restaurant.get('name', '')} немає потрібних страв")
+            # Повний прохід дешевий (перевірка біта маски), а обрізати список тут не можна:
+            # він упорядкований за релевантністю, а кандидатів для OpenAI обираємо випадково з усього списку
+            menu_mask = self._category_mask('menu', requested_dishes)
+            category_masks = self._category_masks
+            row_of = self._row_of
+            filtered_restaurants = [
+                restaurant for restaurant in restaurant_list
+                if category_masks[row_of[id(restaurant)]] & menu_mask
+            ]
+            if logger.isEnabledFor(logging.DEBUG):
+                for restaurant in filtered_restaurants:
+                    logger.debug("   ✅ %s має потрібні страви", restaurant.get('name', ''))
             
             if filtered_restaurants:
                 logger.info(f"📋 Відфільтровано до {len(filtered_restaurants)} закладів з потрібними стравами")
@@ -1061,18 +1586,71 @@ class EnhancedRestaurantBot:
             logger.info("🔍 Загальний запит, аналізую всі ресторани")
             return restaurant_list
 
+    def _score_and_filter(self, user_lower: str, intents: Dict[str, Tuple[str, ...]], restaurant_list):
+        """Фільтрація за типом закладу, контекстом і меню за один прохід по закладах.
+        Результат такий самий, як у послідовних фільтрів типу, контексту та меню."""
+        old_types = [
+            detected_type
+            for establishment_type in intents['type']
+            for detected_type in TYPE_KEYWORDS[establishment_type]['establishment_types']
+        ]
+        if ENHANCED_SEARCH_CONFIG['enabled']:
+            detected_types = self._detect_enhanced_types(user_lower)
+            fallback_types = old_types if ENHANCED_SEARCH_CONFIG['fallback_to_old'] else []
+        else:
+            detected_types = old_types
+            fallback_types = []
+        detected_contexts = intents['context']
+        requested_dishes = intents['menu']
+        
+        type_mask = self._category_mask('type', detected_types)
+        fallback_mask = self._category_mask('type', fallback_types)
+        context_mask = self._category_mask('context', detected_contexts)
+        menu_mask = self._category_mask('menu', requested_dishes)
+        
+        if not (detected_types or detected_contexts or requested_dishes):
+            # Фільтрувати нічим - список не змінюється, тож не копіюємо його
+            logger.info(f"🧮 Фільтрація з {len(restaurant_list)} закладів: у запиті немає типу, контексту чи страв")
+            return restaurant_list
+        
+        # Етапи працюють з номерами рядків і перевіряють лише біти масок категорій
+        category_masks = self._category_masks
+        row_of = self._row_of
+        rows = [row_of[id(restaurant)] for restaurant in restaurant_list]
+        
+        # Кожен етап, що нічого не знайшов, залишає заклади попереднього етапу
+        if detected_types:
+            type_rows = [row for row in rows if category_masks[row] & type_mask]
+            if not type_rows and fallback_types:
+                type_rows = [row for row in rows if category_masks[row] & fallback_mask]
+            rows = type_rows or rows
+        type_count = len(rows)
+        
+        if detected_contexts:
+            context_rows = [row for row in rows if category_masks[row] & context_mask]
+            if context_rows:
+                context_rows.sort(key=lambda row: (category_masks[row] & context_mask).bit_count(), reverse=True)
+                rows = context_rows
+        context_count = len(rows)
+        
+        if requested_dishes:
+            rows = [row for row in rows if category_masks[row] & menu_mask] or rows
+        
+        logger.info(
+            f"🧮 Фільтрація з {len(restaurant_list)} закладів: тип {detected_types} → {type_count}, "
+            f"контекст {list(detected_contexts)} → {context_count}, меню {list(requested_dishes)} → {len(rows)}"
+        )
+        restaurants = self.restaurants_data
+        return [restaurants[row] for row in rows]
+
     async def get_recommendation(self, user_request: str) -> Optional[Dict]:
         """Отримання рекомендації через OpenAI з урахуванням типу закладу, контексту та меню"""
+        # Нормалізуємо запит і шукаємо в ньому ключові слова один раз для всіх фільтрів
+        user_lower = user_request.casefold()
+        intents = _resolve_intents(user_lower)
+        
         try:
-            global openai_client
-            if openai_client is None:
-                import openai
-                openai.api_key = OPENAI_API_KEY
-                openai_client = openai
-                logger.info("✅ OpenAI клієнт ініціалізовано")
-            
-            # ОНОВЛЮЄМО ДАНІ З GOOGLE ТАБЛИЦІ ПЕРЕД КОЖНИМ ЗАПИТОМ
-            logger.info("🔄 Оновлюю дані з Google таблиці...")
+            # Дані з Google таблиці оновлюються, лише якщо минув SHEETS_CACHE_TTL (інакше одразу повертаємось)
             refresh_success = await self.refresh_restaurants_data()
             if not refresh_success:
                 logger.warning("⚠️ Не вдалося оновити дані, використовую кешовані")
@@ -1081,25 +1659,28 @@ class EnhancedRestaurantBot:
                 logger.error("❌ Немає даних про ресторани")
                 return None
             
-            import random
-            shuffled_restaurants = self.restaurants_data.copy()
-            random.shuffle(shuffled_restaurants)
+            cache_key = self._recommendation_cache_key(user_lower)
+            cached = self._rec_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                logger.info(f"♻️ Рекомендацію для '{user_request}' взято з кешу")
+                return self._copy_recommendation(cached)
             
-            logger.info(f"🎲 Перемішав порядок ресторанів для різноманітності")
+            # Фільтри не змінюють список, тому працюємо з даними напряму, без копії
+            candidates = self.restaurants_data
             
             # 🔎 КОМПЛЕКСНИЙ АНАЛІЗ ПО ВСІХ КОЛОНКАХ
-            has_specific_criteria, relevant_restaurants, analysis_explanation = self._comprehensive_content_analysis(user_request)
+            has_specific_criteria, relevant_restaurants, analysis_explanation = self._comprehensive_content_analysis(user_lower)
             
             if has_specific_criteria:
                 # Знайдено специфічні критерії - використовуємо тільки релевантні заклади
                 logger.info(f"🎯 ВИКОРИСТОВУЮ КОМПЛЕКСНИЙ АНАЛІЗ: {analysis_explanation}")
-                shuffled_restaurants = [item['restaurant'] for item in relevant_restaurants]
-                logger.info(f"📊 Відібрано {len(shuffled_restaurants)} найрелевантніших закладів")
+                candidates = [item['restaurant'] for item in relevant_restaurants]
+                logger.info(f"📊 Відібрано {len(candidates)} найрелевантніших закладів")
             else:
                 # Не знайдено специфічних критеріїв - перевіряємо чи це запит про конкретну страву
                 logger.info("🔍 Комплексний аналіз не знайшов критеріїв, перевіряю конкретні страви...")
                 
-                has_dish, dishes_info = self._check_dish_availability(user_request)
+                has_dish, dishes_info = self._check_dish_availability(user_lower)
                 
                 # Якщо користувач шукав конкретні страви
                 if dishes_info:  # Якщо були знайдені конкретні страви в запиті
@@ -1107,38 +1688,22 @@ class EnhancedRestaurantBot:
                         missing_dishes = ", ".join(dishes_info)
                         logger.warning(f"❌ ВІДСУТНЯ СТРАВА: користувач шукав '{missing_dishes}', але її немає в жодному ресторані")
                         
-                        return {
+                        return self._remember_recommendation(cache_key, {
                             "dish_not_found": True,
                             "missing_dishes": missing_dishes,
                             "message": f"На жаль, {missing_dishes} ще немає в нашому переліку. Спробуй іншу страву!"
-                        }
+                        })
                     else:  # Страви є - фільтруємо тільки ресторани з цими стравами
                         logger.info(f"🎯 ФОКУС НА СТРАВАХ: користувач шукав '{dishes_info}' - фільтрую тільки ресторани з цими стравами")
-                        # Фільтруємо shuffled_restaurants до тільки тих, що мають потрібні страви
+                        # Фільтруємо candidates до тільки тих, що мають потрібні страви
                         dish_filtered_restaurants = []
-                        for restaurant in shuffled_restaurants:
-                            menu_text = restaurant.get('menu', '').lower()
-                            has_required_dish = False
-                            
-                            for dish in dishes_info:
-                                dish_keywords = self._get_dish_keywords(dish)
-                                for keyword in dish_keywords:
-                                    if ENHANCED_SEARCH_CONFIG['regex_boundaries']:
-                                        pattern = r'\b' + re.escape(keyword.lower()) + r'\b'
-                                        if re.search(pattern, menu_text):
-                                            has_required_dish = True
-                                            logger.info(f"   ✅ {restaurant.get('name', '')} має {dish}")
-                                            break
-                                    else:
-                                        if keyword.lower() in menu_text:
-                                            has_required_dish = True
-                                            logger.info(f"   ✅ {restaurant.get('name', '')} має {dish}")
-                                            break
-                                if has_required_dish:
-                                    break
-                            
-                            if has_required_dish:
+                        debug_log = logger.isEnabledFor(logging.DEBUG)
+                        dish_mask = self._category_mask('dish', dishes_info)
+                        for restaurant in candidates:
+                            if self._restaurant_mask(restaurant) & dish_mask:
                                 dish_filtered_restaurants.append(restaurant)
+                                if debug_log:
+                                    logger.debug("   ✅ %s має потрібні страви", restaurant.get('name', ''))
                         
                         if not dish_filtered_restaurants:
                             logger.error(f"❌ КРИТИЧНА ПОМИЛКА: функція сказала що страви є, але фільтр не знайшов ресторанів")
@@ -1148,100 +1713,152 @@ class EnhancedRestaurantBot:
                                 "message": f"На жаль, {', '.join(dishes_info)} ще немає в нашому переліку. Спробуй іншу страву!"
                             }
                         
-                        logger.info(f"🍽️ Відфільтровано до {len(dish_filtered_restaurants)} ресторанів з потрібними стравами з {len(shuffled_restaurants)}")
-                        shuffled_restaurants = dish_filtered_restaurants
+                        logger.info(f"🍽️ Відфільтровано до {len(dish_filtered_restaurants)} ресторанів з потрібними стравами з {len(candidates)}")
+                        candidates = dish_filtered_restaurants
             
             # ТРЬОХЕТАПНА ФІЛЬТРАЦІЯ для максимальної точності:
-            
-            # 1. Спочатку фільтруємо за ТИПОМ ЗАКЛАДУ (покращено!)
-            if ENHANCED_SEARCH_CONFIG['enabled']:
-                type_filtered = self._enhanced_filter_by_establishment_type(user_request, shuffled_restaurants)
+            if ENHANCED_SEARCH_CONFIG['fused_filter']:
+                final_filtered = self._score_and_filter(user_lower, intents, candidates)
             else:
-                type_filtered = self._filter_by_establishment_type(user_request, shuffled_restaurants)
-            
-            # 2. Потім фільтруємо за КОНТЕКСТОМ
-            context_filtered = self._filter_by_context(user_request, type_filtered)
-            
-            # 3. Нарешті фільтруємо по МЕНЮ
-            final_filtered = self._filter_by_menu(user_request, context_filtered)
-            
-            restaurants_details = []
-            for i, r in enumerate(final_filtered):
-                establishment_type = r.get('тип закладу', r.get('type', 'Не вказано'))
-                detail = f"""Варіант {i+1}:
-- Назва: {r.get('name', 'Без назви')}
-- Тип: {establishment_type}
-- Атмосфера: {r.get('vibe', 'Не описана')}
-- Призначення: {r.get('aim', 'Не вказано')}
-- Кухня: {r.get('cuisine', 'Не вказана')}"""
-                restaurants_details.append(detail)
-            
-            restaurants_text = "\n\n".join(restaurants_details)
-            
-            prompt = f"""ЗАПИТ КОРИСТУВАЧА: "{user_request}"
-
-ВАЖЛИВО: Всі заклади нижче пройшли ЧОТИРЬОХЕТАПНУ ФІЛЬТРАЦІЮ і максимально підходять під запит.
-
-{restaurants_text}
-
-ЗАВДАННЯ:
-1. Обери 2 НАЙКРАЩІ варіанти (якщо є тільки 1 варіант, то тільки його)
-2. Вкажи який з них є ПРІОРИТЕТНИМ і коротко поясни ЧОМУ
-
-ФОРМАТ ВІДПОВІДІ:
-Варіанти: [номер1, номер2]
-Пріоритет: [номер] - [коротке пояснення причини]
-
-ПРИКЛАД:
-Варіанти: [1, 3]
-Пріоритет: 1 - ідеально підходить за атмосферою та розташуванням
-
-ТВОЯ ВІДПОВІДЬ:"""
+                # 1. Спочатку фільтруємо за ТИПОМ ЗАКЛАДУ (покращено!)
+                if ENHANCED_SEARCH_CONFIG['enabled']:
+                    type_filtered = self._enhanced_filter_by_establishment_type(user_lower, intents, candidates)
+                else:
+                    type_filtered = self._filter_by_establishment_type(user_lower, intents, candidates)
+                
+                # 2. Потім фільтруємо за КОНТЕКСТОМ
+                context_filtered = self._filter_by_context(user_lower, intents, type_filtered)
+                
+                # 3. Нарешті фільтруємо по МЕНЮ
+                final_filtered = self._filter_by_menu(user_lower, intents, context_filtered)
+            
+            # Для різноманітності до OpenAI потрапляє випадкова підмножина кандидатів (у порядку релевантності)
+            if len(final_filtered) > MAX_PROMPT_CANDIDATES:
+                picked_rows = sorted(_rng.sample(range(len(final_filtered)), MAX_PROMPT_CANDIDATES))
+                logger.info(f"🎲 Випадково обрано {MAX_PROMPT_CANDIDATES} кандидатів з {len(final_filtered)}")
+                final_filtered = [final_filtered[row] for row in picked_rows]
+            
+            # Поки чекаємо на OpenAI, інше оновлення може перезавантажити дані й перебудувати індекс,
+            # тож номери рядків, картки й маски для розбору відповіді фіксуємо до запиту
+            row_of = self._row_of
+            filtered_rows = [row_of[id(restaurant)] for restaurant in final_filtered]
+            views = self._views
+            category_masks = self._category_masks
+            user_fallback_mask = self._category_mask('fallback', FALLBACK_USER_SCANNER.scan(user_lower))
+            
+            restaurants_text = self._restaurants_prompt_text(final_filtered)
+            prompt = RECOMMENDATION_PROMPT_TEMPLATE.format(user_request=user_request, restaurants_text=restaurants_text)
 
             logger.info(f"🤖 Запитую у OpenAI 2 найкращі варіанти з {len(final_filtered)} відфільтрованих...")
             
             # Показуємо деталі всіх варіантів для діагностики
-            for i, r in enumerate(final_filtered):
-                logger.info(f"   {i+1}. {r.get('name', '')} ({r.get('тип закладу', r.get('type', ''))} | {r.get('vibe', '')} | {r.get('aim', '')})")
-
-            def make_openai_request():
-                return openai_client.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "Ти експерт-ресторатор. Аналізуй варіанти та обирай найкращі з обґрунтуванням."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=200,
-                    temperature=0.3,
-                    top_p=0.9
-                )
-            
-            response = await asyncio.wait_for(
-                asyncio.to_thread(make_openai_request),
-                timeout=20
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, r in enumerate(final_filtered):
+                    logger.debug("   %d. %s (%s | %s | %s)", i + 1, r.get('name', ''), r.get('тип закладу', r.get('type', '')), r.get('vibe', ''), r.get('aim', ''))
+
+            stream = await openai_client.chat.completions.create(
+                messages=[OPENAI_SYSTEM_MESSAGE, {"role": "user", "content": prompt}],
+                stream=True,
+                **OPENAI_COMPLETION_OPTIONS
             )
-            
-            choice_text = response.choices[0].message.content.strip()
-            logger.info(f"🤖 OpenAI повна відповідь: '{choice_text}'")
+            choice_text = await self._read_recommendation_reply(stream)
+            logger.info(f"🤖 OpenAI відповідь: '{choice_text}'")
             
             # Парсимо відповідь OpenAI
-            recommendations = self._parse_dual_recommendation(choice_text, final_filtered)
+            recommendations = self._parse_dual_recommendation(choice_text, filtered_rows, views)
             
             if recommendations:
-                return recommendations
+                return self._remember_recommendation(cache_key, recommendations)
             else:
                 logger.warning("⚠️ Не вдалось розпарсити відповідь OpenAI, використовую резервний алгоритм")
-                return self._fallback_dual_selection(user_request, final_filtered)
+                return self._fallback_dual_rows(filtered_rows, views, category_masks, user_fallback_mask)
             
-        except asyncio.TimeoutError:
+        except (asyncio.TimeoutError, APITimeoutError):
             logger.error("⏰ Timeout при запиті до OpenAI, використовую резервний алгоритм")
-            return self._fallback_dual_selection(user_request, self.restaurants_data)
+            return self._fallback_dual_selection(user_lower, self.restaurants_data)
         except Exception as e:
             logger.error(f"❌ Помилка отримання рекомендації: {e}")
-            return self._fallback_dual_selection(user_request, self.restaurants_data)
+            return self._fallback_dual_selection(user_lower, self.restaurants_data)
+
+    @staticmethod
+    async def _read_recommendation_reply(stream) -> str:
+        """Читає потокову відповідь OpenAI лише до кінця рядка з пріоритетом:
+        парсер використовує тільки рядки варіантів і пріоритету, тож решту не чекаємо"""
+        chunks = []
+        # Незавершений останній рядок: перевіряємо лише нові рядки, а не всю відповідь заново
+        tail = ''
+        try:
+            # Таймаут httpx обмежує кожне читання окремо, а цей - усю відповідь
+            async with asyncio.timeout(OPENAI_TIMEOUT):
+                async for chunk in stream:
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if not content:
+                        continue
+                    chunks.append(content)
+                    if '\n' not in content:
+                        tail += content
+                        continue
+                    *complete_lines, tail = (tail + content).split('\n')
+                    if any(line.strip().lower().startswith('пріоритет') and '-' in line for line in complete_lines):
+                        break
+        finally:
+            await stream.response.aclose()
+        return ''.join(chunks).strip()
+
+    def _restaurants_prompt_text(self, restaurants: List[Dict]) -> str:
+        """Опис варіантів для промпту з описів, підготовлених при завантаженні даних"""
+        prompt_cards = self._prompt_cards
+        row_of = self._row_of
+        return "\n\n".join(
+            f"Варіант {number}:\n{prompt_cards[row_of[id(restaurant)]]}"
+            for number, restaurant in enumerate(restaurants, 1)
+        )
+
+    def _recommendation_cache_key(self, user_lower: str) -> Optional[Tuple[int, str]]:
+        """Ключ кешу рекомендацій або None, якщо запит не варто кешувати"""
+        if EPHEMERAL_REQUEST_RE.search(user_lower):
+            return None
+        normalized = WHITESPACE_RE.sub(' ', REQUEST_PUNCTUATION_RE.sub(' ', user_lower)).strip()[:RECOMMENDATION_KEY_MAX_LENGTH]
+        return (self._data_version, normalized)
 
-    def _parse_dual_recommendation(self, openai_response: str, filtered_restaurants):
-        """Парсить відповідь OpenAI з двома рекомендаціями"""
+    def _remember_recommendation(self, cache_key: Optional[Tuple[int, str]], recommendation: Dict) -> Dict:
+        """Зберігає рекомендацію в кеші (давно не використані та застарілі записи витісняються)"""
+        if cache_key is not None:
+            self._rec_cache[cache_key] = self._copy_recommendation(recommendation)
+        return recommendation
+
+    @staticmethod
+    def _copy_recommendation(recommendation: Dict) -> Dict:
+        """Копія рекомендації: значення закладів - рядки й числа, тож достатньо скопіювати самі словники"""
+        copied = dict(recommendation)
+        if "restaurants" in copied:
+            copied["restaurants"] = [dict(view) for view in copied["restaurants"]]
+        return copied
+
+    def _build_restaurant_view(self, row: int, restaurant: Dict) -> Dict:
+        """Дані закладу для відповіді користувачу (з готовою HTML-карткою)"""
+        view = {key: restaurant.get(key, default) for key, default in RESTAURANT_DEFAULTS.items()}
+        establishment_type = self._type_labels[row]
+        view["type"] = 'Заклад' if establishment_type is None else establishment_type
+        view["card"] = RESTAURANT_CARD_TEMPLATE.format_map(
+            {key: html.escape(str(value), quote=False) for key, value in view.items()}
+        )
+        view["menu_ok"] = str(view["menu_url"]).startswith('http')
+        view["photo_ok"] = str(view["photo"]).startswith('http')
+        return view
+
+    @staticmethod
+    def _bracket_numbers(variants_line: str) -> List[str]:
+        """Номери зі списку в квадратних дужках або [], якщо формат інший"""
+        start = variants_line.find('[')
+        end = variants_line.find(']', start + 1)
+        if start == -1 or end == -1:
+            return []
+        numbers = [part.strip() for part in variants_line[start + 1:end].split(',')]
+        return numbers if all(number.isdecimal() for number in numbers) else []
+
+    def _parse_dual_recommendation(self, openai_response: str, filtered_rows: List[int], views: List[Dict]):
+        """Парсить відповідь OpenAI з двома рекомендаціями (варіанти - рядки filtered_rows у views)"""
         try:
             lines = openai_response.strip().split('\n')
             variants_line = ""
@@ -1256,22 +1873,22 @@ class EnhancedRestaurantBot:
             
             logger.info(f"🔍 Парсинг - Варіанти: '{variants_line}', Пріоритет: '{priority_line}'")
             
-            # Витягуємо номери варіантів
-            import re
-            numbers = re.findall(r'\d+', variants_line)
+            # Витягуємо номери варіантів: зазвичай це "Варіанти: [1, 3]", тож спершу
+            # розбираємо вміст дужок напряму, а регулярний вираз - лише для інших форматів
+            numbers = self._bracket_numbers(variants_line) or NUMBER_RE.findall(variants_line)
             
             if len(numbers) >= 1:
                 # Конвертуємо в індекси (мінус 1)
                 indices = [int(num) - 1 for num in numbers[:2]]  # Беремо максимум 2
                 
                 # Перевіряємо що індекси в межах
-                valid_indices = [idx for idx in indices if 0 <= idx < len(filtered_restaurants)]
+                valid_indices = [idx for idx in indices if 0 <= idx < len(filtered_rows)]
                 
                 if not valid_indices:
                     logger.warning("⚠️ Всі індекси поза межами")
                     return None
                 
-                restaurants = [filtered_restaurants[idx] for idx in valid_indices]
+                restaurant_rows = [filtered_rows[idx] for idx in valid_indices]
                 
                 # Визначаємо пріоритетний ресторан
                 priority_num = None
@@ -1279,9 +1896,9 @@ class EnhancedRestaurantBot:
                 
                 if priority_line and '-' in priority_line:
                     # Шукаємо номер пріоритету
-                    priority_match = re.search(r'(\d+)', priority_line.split('-')[0])
+                    priority_match = NUMBER_RE.search(priority_line.split('-')[0])
                     if priority_match:
-                        priority_num = int(priority_match.group(1))
+                        priority_num = int(priority_match.group())
                     
                     # Витягуємо пояснення
                     explanation_part = priority_line.split('-', 1)[1].strip()
@@ -1294,7 +1911,7 @@ class EnhancedRestaurantBot:
                 else:
                     priority_index = 0  # За замовчуванням перший
                 
-                logger.info(f"✅ Розпарсено: {len(restaurants)} ресторанів, пріоритет: {priority_index + 1}")
+                logger.info(f"✅ Розпарсено: {len(restaurant_rows)} ресторанів, пріоритет: {priority_index + 1}")
                 
                 # Повертаємо структуру з двома рекомендаціями
                 result = {
@@ -1303,23 +1920,8 @@ class EnhancedRestaurantBot:
                     "priority_explanation": priority_explanation
                 }
                 
-                for restaurant in restaurants:
-                    photo_url = restaurant.get('photo', '')
-                    if photo_url:
-                        photo_url = self._convert_google_drive_url(photo_url)
-                    
-                    result["restaurants"].append({
-                        "name": restaurant.get('name', 'Ресторан'),
-                        "address": restaurant.get('address', 'Адреса не вказана'),
-                        "socials": restaurant.get('socials', 'Соц-мережі не вказані'),
-                        "vibe": restaurant.get('vibe', 'Приємна атмосфера'),
-                        "aim": restaurant.get('aim', 'Для будь-яких подій'),
-                        "cuisine": restaurant.get('cuisine', 'Смачна кухня'),
-                        "menu": restaurant.get('menu', ''),
-                        "menu_url": restaurant.get('menu_url', ''),
-                        "photo": photo_url,
-                        "type": restaurant.get('тип закладу', restaurant.get('type', 'Заклад'))
-                    })
+                for row in restaurant_rows:
+                    result["restaurants"].append(dict(views[row]))
                 
                 return result
             
@@ -1330,65 +1932,46 @@ class EnhancedRestaurantBot:
             logger.error(f"❌ Помилка парсингу відповіді OpenAI: {e}")
             return None
 
-    def _fallback_dual_selection(self, user_request: str, restaurant_list):
+    def _fallback_dual_selection(self, user_lower: str, restaurant_list):
         """Резервний алгоритм для двох рекомендацій"""
-        if not restaurant_list:
+        row_of = self._row_of
+        # Категорії закладів уже в індексі, тож для запиту лишається визначити лише його категорії
+        user_mask = self._category_mask('fallback', FALLBACK_USER_SCANNER.scan(user_lower))
+        return self._fallback_dual_rows(
+            [row_of[id(restaurant)] for restaurant in restaurant_list],
+            self._views,
+            self._category_masks,
+            user_mask
+        )
+
+    @staticmethod
+    def _fallback_dual_rows(rows: List[int], views: List[Dict], category_masks: List[int], user_mask: int):
+        """Резервний вибір двох закладів з рядків rows (views і маски - з тієї ж версії даних)"""
+        if not rows:
             return None
         
-        import random
-        
         # Якщо тільки один ресторан
-        if len(restaurant_list) == 1:
-            chosen = restaurant_list[0]
-            photo_url = chosen.get('photo', '')
-            if photo_url:
-                photo_url = self._convert_google_drive_url(photo_url)
-                
+        if len(rows) == 1:
             return {
-                "restaurants": [{
-                    "name": chosen.get('name', 'Ресторан'),
-                    "address": chosen.get('address', 'Адреса не вказана'),
-                    "socials": chosen.get('socials', 'Соц-мережі не вказані'),
-                    "vibe": chosen.get('vibe', 'Приємна атмосфера'),
-                    "aim": chosen.get('aim', 'Для будь-яких подій'),
-                    "cuisine": chosen.get('cuisine', 'Смачна кухня'),
-                    "menu": chosen.get('menu', ''),
-                    "menu_url": chosen.get('menu_url', ''),
-                    "photo": photo_url,
-                    "type": chosen.get('тип закладу', chosen.get('type', 'Заклад'))
-                }],
+                "restaurants": [dict(views[rows[0]])],
                 "priority_index": 0,
                 "priority_explanation": "єдиний доступний варіант після фільтрації"
             }
         
-        # Використовуємо розумний алгоритм для вибору 2 найкращих
-        scored_restaurants = []
-        user_lower = user_request.lower()
-        
-        keywords_map = {
-            'romantic': (['романт', 'побачен', 'інтимн'], ['інтимн', 'романт', 'пар']),
-            'family': (['сім', 'діт', 'родин'], ['сімейн', 'діт', 'родин']),
-            'business': (['діл', 'зустріч', 'бізнес'], ['діл', 'бізнес']),
-            'friends': (['друз', 'компан', 'весел'], ['компан', 'друз', 'молодіжн'])
-        }
-        
-        for restaurant in restaurant_list:
-            score = 0
-            restaurant_text = f"{restaurant.get('vibe', '')} {restaurant.get('aim', '')}".lower()
-            
-            for category, (user_keywords, restaurant_keywords) in keywords_map.items():
-                user_match = any(keyword in user_lower for keyword in user_keywords)
-                if user_match:
-                    restaurant_match = any(keyword in restaurant_text for keyword in restaurant_keywords)
-                    if restaurant_match:
-                        score += 3
+        if not user_mask:
+            # Жодна категорія не збігається - оцінки були б лише випадковими,
+            # тож одразу беремо два випадкові заклади
+            top_rows = _rng.sample(rows, 2)
+        else:
+            # Використовуємо розумний алгоритм для вибору 2 найкращих
+            scored_rows = []
+            for row in rows:
+                score = FALLBACK_CATEGORY_SCORE * (category_masks[row] & user_mask).bit_count()
+                score += _rng.uniform(0, 1)  # Невеликий випадковий бонус
+                scored_rows.append((score, row))
             
-            score += random.uniform(0, 1)  # Невеликий випадковий бонус
-            scored_restaurants.append((score, restaurant))
-        
-        # Сортуємо та беремо топ-2
-        scored_restaurants.sort(key=lambda x: x[0], reverse=True)
-        top_restaurants = [item[1] for item in scored_restaurants[:2]]
+            # Беремо топ-2 без сортування всього списку
+            top_rows = [item[1] for item in heapq.nlargest(2, scored_rows, key=itemgetter(0))]
         
         # Формуємо результат
         result = {
@@ -1397,57 +1980,198 @@ class EnhancedRestaurantBot:
             "priority_explanation": "найвищий рейтинг за алгоритмом відповідності"
         }
         
-        for restaurant in top_restaurants:
-            photo_url = restaurant.get('photo', '')
-            if photo_url:
-                photo_url = self._convert_google_drive_url(photo_url)
-            
-            result["restaurants"].append({
-                "name": restaurant.get('name', 'Ресторан'),
-                "address": restaurant.get('address', 'Адреса не вказана'),
-                "socials": restaurant.get('socials', 'Соц-мережі не вказані'),
-                "vibe": restaurant.get('vibe', 'Приємна атмосфера'),
-                "aim": restaurant.get('aim', 'Для будь-яких подій'),
-                "cuisine": restaurant.get('cuisine', 'Смачна кухня'),
-                "menu": restaurant.get('menu', ''),
-                "menu_url": restaurant.get('menu_url', ''),
-                "photo": photo_url,
-                "type": restaurant.get('тип закладу', restaurant.get('type', 'Заклад'))
-            })
+        for row in top_rows:
+            result["restaurants"].append(dict(views[row]))
         
         logger.info(f"🎯 Резервний алгоритм: обрано {len(result['restaurants'])} ресторанів")
         return result
 
-    async def log_request(self, user_id: int, user_request: str, restaurant_name: str, rating: Optional[int] = None, explanation: str = ""):
-        """Логування запиту до аналітичної таблиці"""
+    def log_request(self, user_id: int, user_request: str, restaurant_name: str, rating: Optional[int] = None, explanation: str = ""):
+        """Логування запиту до аналітичної таблиці (лише ставить рядок у чергу, тож не блокує відповідь)"""
         if not self.analytics_sheet:
             logger.warning("Analytics sheet недоступний")
             return
             
-        try:
-            now = datetime.now()
-            timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
-            date = now.strftime("%Y-%m-%d")
-            time = now.strftime("%H:%M:%S")
-            
-            row_data = [
-                timestamp,
-                str(user_id),
-                user_request,
-                restaurant_name,
-                str(rating) if rating else "",
-                explanation,
-                date,
-                time
-            ]
-            
-            self.analytics_sheet.append_row(row_data)
-            logger.info(f"📊 Записано до Analytics: {user_id} - {restaurant_name} - Оцінка: {rating} - Пояснення: {explanation[:50]}...")
-            
+        # Дата і час - частини того самого рядка, тож форматуємо лише раз
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        date, time = timestamp.split(' ')
+        
+        row_data = [
+            timestamp,
+            str(user_id),
+            user_request,
+            restaurant_name,
+            str(rating) if rating else "",
+            explanation,
+            date,
+            time
+        ]
+        
+        # Сам запис робить _analytics_flush_loop, відповідь користувачу на нього не чекає
+        self._analytics_queue.put_nowait(row_data)
+        logger.info(f"📊 Додано до черги Analytics: {user_id} - {restaurant_name} - Оцінка: {rating} - Пояснення: {explanation[:50]}...")
+    
+    async def _analytics_flush_loop(self):
+        """Фонова задача: збирає рядки з черги і записує їх одним append_rows
+        кожні ANALYTICS_FLUSH_INTERVAL секунд або щойно набереться ANALYTICS_BATCH_SIZE"""
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = [await self._analytics_queue.get()]
+            deadline = loop.time() + ANALYTICS_FLUSH_INTERVAL
+            try:
+                while len(rows) < ANALYTICS_BATCH_SIZE:
+                    rows.append(await asyncio.wait_for(self._analytics_queue.get(), deadline - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Бот зупиняється - записуємо вже зібрані рядки
+                await self._write_analytics_rows(rows)
+                raise
+            await self._write_analytics_rows(rows)
+    
+    async def _write_analytics_rows(self, rows: List[List[str]]):
+        """Записує пакет рядків в Analytics з повторними спробами і оновлює статистику"""
+        for attempt in range(ANALYTICS_WRITE_ATTEMPTS):
+            try:
+                await asyncio.to_thread(self.analytics_sheet.append_rows, rows)
+                break
+            except Exception as e:
+                if attempt == ANALYTICS_WRITE_ATTEMPTS - 1:
+                    logger.error(f"Помилка логування: {e}, втрачено рядків: {len(rows)}")
+                    return
+                delay = 2 ** attempt
+                logger.warning(f"⚠️ Помилка запису в Analytics: {e}, повтор через {delay} с")
+                await asyncio.sleep(delay)
+        
+        logger.info(f"📊 Записано до Analytics рядків: {len(rows)}")
+        for row in rows:
+            self._count_analytics_row(row[1], row[4])
+        self._schedule_summary_update()
+    
+    async def flush_analytics(self):
+        """Зупиняє фонову задачу і записує все, що ще залишилось у черзі"""
+        if self._analytics_task is not None:
+            self._analytics_task.cancel()
+            try:
+                await self._analytics_task
+            except asyncio.CancelledError:
+                pass
+            self._analytics_task = None
+        
+        rows = []
+        while not self._analytics_queue.empty():
+            rows.append(self._analytics_queue.get_nowait())
+        if rows and self.analytics_sheet:
+            await self._write_analytics_rows(rows)
+        if self._summary_task is not None:
+            self._summary_flush_now.set()
+            await self._summary_task
+    
+    def _schedule_summary_update(self):
+        """Оновлює Summary у фоні; якщо оновлення вже йде, після нього буде ще одне з новими даними"""
+        self._summary_pending = True
+        if self._summary_task is None or self._summary_task.done():
+            self._summary_task = asyncio.create_task(self._summary_update_loop())
+    
+    async def _summary_update_loop(self):
+        """Оновлює Summary, доки є непоказані зміни лічильників (не частіше за SUMMARY_UPDATE_COOLDOWN)"""
+        loop = asyncio.get_running_loop()
+        while self._summary_pending:
+            delay = self._last_summary_write + SUMMARY_UPDATE_COOLDOWN - loop.time()
+            if delay > 0 and not self._summary_flush_now.is_set():
+                try:
+                    await asyncio.wait_for(self._summary_flush_now.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._summary_pending = False
             await self.update_summary_stats()
-            
+            self._last_summary_write = loop.time()
+    
+    def _count_analytics_row(self, user_id, rating):
+        """Враховує один рядок Analytics у лічильниках статистики"""
+        self._total_requests += 1
+        self._unique_users.add(self._user_key(user_id))
+        if rating and str(rating).isdigit():
+            self._rating_sum += int(rating)
+            self._rating_count += 1
+    
+    @staticmethod
+    def _user_key(user_id):
+        """Ключ користувача в множині унікальних: числові ID зберігаємо як int (менше пам'яті, ніж рядок)"""
+        user_id = str(user_id)
+        return int(user_id) if user_id.isdigit() else user_id
+    
+    async def _load_summary_counters(self, headers: List[str]) -> bool:
+        """Рахує статистику за всіма наявними рядками Analytics (при старті або повторно після помилки)"""
+        try:
+            if "User ID" in headers and "Rating" in headers:
+                # Для статистики потрібні лише дві колонки, а не весь аркуш
+                user_column, rating_column = (
+                    gspread.utils.rowcol_to_a1(1, headers.index(name) + 1)[:-1]
+                    for name in ("User ID", "Rating")
+                )
+                user_values, rating_values = await asyncio.to_thread(
+                    self.analytics_sheet.batch_get,
+                    [f"{user_column}2:{user_column}", f"{rating_column}2:{rating_column}"]
+                )
+                user_ids = [row[0] if row else '' for row in user_values]
+                ratings = [row[0] if row else '' for row in rating_values]
+            else:
+                all_records = await asyncio.to_thread(self.analytics_sheet.get_all_records)
+                user_ids = [record.get('User ID', '') for record in all_records]
+                ratings = [record.get('Rating') for record in all_records]
         except Exception as e:
-            logger.error(f"Помилка логування: {e}")
+            logger.error(f"Помилка читання Analytics для статистики: {e}")
+            return False
+        
+        # Один прохід по всіх рядках з локальними лічильниками. Аркуш уже містить і рядки,
+        # записані цим процесом, тож лічильники замінюються, а не доповнюються
+        users = set(map(self._user_key, user_ids))
+        rating_sum = 0
+        rating_count = 0
+        for rating in ratings:
+            if rating and str(rating).isdigit():
+                rating_sum += int(rating)
+                rating_count += 1
+        
+        self._unique_users = users
+        self._total_requests = len(user_ids)
+        self._rating_sum = rating_sum
+        self._rating_count = rating_count
+        self._summary_counters_loaded = True
+        logger.info(f"📈 Статистика з Analytics: {self._total_requests} запитів, {len(self._unique_users)} користувачів")
+        return True
+    
+    async def get_summary_rows(self) -> List[List[str]]:
+        """Рядки з метриками Summary; повторні /stats протягом SUMMARY_STATS_CACHE_TTL не роблять запитів до API"""
+        now = time.monotonic()
+        if self._summary_rows is None or now - self._summary_rows_at >= SUMMARY_STATS_CACHE_TTL:
+            # Читаємо лише рядки з метриками, а не весь аркуш
+            rows = await asyncio.to_thread(self.summary_sheet.get, SUMMARY_STATS_RANGE)
+            if rows != self._summary_rows:
+                self._summary_rows = rows
+                self._stats_text = None
+            self._summary_rows_at = now
+        return self._summary_rows
+    
+    async def get_stats_text(self) -> Optional[str]:
+        """Повідомлення /stats; форматується заново лише коли змінились рядки Summary"""
+        summary_data = await self.get_summary_rows()
+        # get() обрізає порожні клітинки в кінці рядка - неповний рядок означає, що даних ще немає
+        if len(summary_data) < SUMMARY_STATS_ROWS or any(len(row) < 2 for row in summary_data[:SUMMARY_STATS_ROWS]):
+            return None
+        
+        if self._stats_text is None:
+            self._stats_text = STATS_TEMPLATE.format(
+                total_requests=summary_data[0][0],
+                unique_users=summary_data[1][0],
+                avg_rating=summary_data[2][0],
+                rating_count=summary_data[3][0],
+                avg_requests_per_user=summary_data[4][0],
+                search_block=STATS_SEARCH_BLOCK,
+                updated_at=summary_data[0][1]
+            )
+        return self._stats_text
     
     async def update_summary_stats(self):
         """Оновлення зведеної статистики"""
@@ -1455,41 +2179,43 @@ class EnhancedRestaurantBot:
             return
             
         try:
-            all_records = self.analytics_sheet.get_all_records()
-            
-            if not all_records:
+            if not self._summary_counters_loaded:
+                # Лічильники лише цього процесу затерли б у Summary справжні підсумки - спершу читаємо Analytics
+                headers = await asyncio.to_thread(self.analytics_sheet.row_values, 1)
+                if not await self._load_summary_counters(headers):
+                    logger.warning("⚠️ Summary не оновлено: статистику з Analytics ще не прочитано")
+                    return
+            
+            total_requests = self._total_requests
+            if not total_requests:
                 return
             
-            total_requests = len(all_records)
-            unique_users = len(set(record['User ID'] for record in all_records))
+            unique_users = len(self._unique_users)
             
-            ratings = [int(record['Rating']) for record in all_records if record['Rating'] and str(record['Rating']).isdigit()]
-            avg_rating = sum(ratings) / len(ratings) if ratings else 0
-            rating_count = len(ratings)
+            rating_count = self._rating_count
+            avg_rating = self._rating_sum / rating_count if rating_count else 0
             
             avg_requests_per_user = total_requests / unique_users if unique_users > 0 else 0
             
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            self.summary_sheet.update('B2', str(total_requests))
-            self.summary_sheet.update('C2', timestamp)
-            
-            self.summary_sheet.update('B3', str(unique_users))
-            self.summary_sheet.update('C3', timestamp)
-            
-            self.summary_sheet.update('B4', f"{avg_rating:.2f}")
-            self.summary_sheet.update('C4', timestamp)
-            
-            self.summary_sheet.update('B5', str(rating_count))
-            self.summary_sheet.update('C5', timestamp)
+            values = (
+                str(total_requests),
+                str(unique_users),
+                f"{avg_rating:.2f}",
+                str(rating_count),
+                f"{avg_requests_per_user:.2f}"
+            )
             
-            try:
-                self.summary_sheet.update('A6', "Середня кількість запитів на користувача")
-                self.summary_sheet.update('B6', f"{avg_requests_per_user:.2f}")
-                self.summary_sheet.update('C6', timestamp)
-            except:
-                self.summary_sheet.append_row(["Середня кількість запитів на користувача", f"{avg_requests_per_user:.2f}", timestamp])
+            # Усі метрики - один суцільний діапазон і один запит
+            await asyncio.to_thread(
+                self.summary_sheet.update,
+                range_name=SUMMARY_METRICS_RANGE,
+                values=[[label, value, timestamp] for label, value in zip(SUMMARY_METRIC_LABELS, values)]
+            )
             
+            self._summary_rows = None
+            self._stats_text = None
             logger.info(f"📈 Оновлено статистику: Запитів: {total_requests}, Користувачів: {unique_users}, Середня оцінка: {avg_rating:.2f}")
             
         except Exception as e:
@@ -1498,217 +2224,288 @@ class EnhancedRestaurantBot:
 # Глобальний екземпляр покращеного бота
 restaurant_bot = EnhancedRestaurantBot()
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def run_in_background(coro):
+    """Запускає корутину у фоні, не чекаючи її завершення"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def delete_message_safely(message):
+    """Видаляє службове повідомлення, не перериваючи обробку у разі помилки"""
+    try:
+        await message.delete()
+    except Exception as e:
+        logger.warning(f"⚠️ Не вдалось видалити повідомлення: {e}")
+
+# Максимальна довжина підпису до фото в Telegram
+PHOTO_CAPTION_LIMIT = 1024
+
+# Користувачі з доступом до /stats (список ID через кому, щоб змінювати без правок коду)
+ADMIN_IDS = frozenset(int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '980047923').split(',') if admin_id.strip())
+# Діапазон аркуша Summary для /stats: лише значення і час оновлення п'яти метрик, без назв і заголовка
+SUMMARY_STATS_RANGE = "B2:C6"
+SUMMARY_STATS_ROWS = 5
+# Назви метрик у колонці A аркуша Summary (рядки 2-6) - записуються разом зі значеннями
+SUMMARY_METRIC_LABELS = (
+    "Загальна кількість запитів",
+    "Кількість унікальних користувачів",
+    "Середня оцінка відповідності",
+    "Кількість оцінок",
+    "Середня кількість запитів на користувача",
+)
+SUMMARY_METRICS_RANGE = f"A2:C{len(SUMMARY_METRIC_LABELS) + 1}"
+
+# Налаштування пошуку не змінюються під час роботи, тож цей блок /stats готуємо один раз
+STATS_SEARCH_BLOCK = (
+    f"🔧 <b>Покращений пошук:</b>\n"
+    f"• Статус: {'✅ Увімкнено' if ENHANCED_SEARCH_CONFIG['enabled'] else '❌ Вимкнено'}\n"
+    f"• Fuzzy matching: {'✅ Увімкнено' if (ENHANCED_SEARCH_CONFIG['fuzzy_matching'] and FUZZY_AVAILABLE) else '❌ Вимкнено'}\n"
+    f"• Negation detection: {'✅' if ENHANCED_SEARCH_CONFIG['negation_detection'] else '❌'}\n"
+    f"• Regex boundaries: {'✅' if ENHANCED_SEARCH_CONFIG['regex_boundaries'] else '❌'}"
+)
+STATS_TEMPLATE = (
+    "📊 <b>Статистика бота</b>\n\n"
+    "📈 Загальна кількість запитів: <b>{total_requests}</b>\n"
+    "👥 Кількість унікальних користувачів: <b>{unique_users}</b>\n"
+    "⭐ Середня оцінка відповідності: <b>{avg_rating}</b>\n"
+    "📢 Кількість оцінок: <b>{rating_count}</b>\n"
+    "📊 Середня кількість запитів на користувача: <b>{avg_requests_per_user}</b>\n\n"
+    "{search_block}\n\n"
+    "🕐 Останнє оновлення: {updated_at}"
+)
+
+# Ліміти вихідних запитів до Telegram (на бота за секунду / на групу за хвилину)
+TELEGRAM_OVERALL_MAX_RATE = 28
+TELEGRAM_GROUP_MAX_RATE = 18
+# Скільки разів повторити запит після 429 (RetryAfter) перед тим, як віддати помилку хендлеру
+TELEGRAM_MAX_RETRIES = 3
+
+# Long polling: Telegram тримає getUpdates відкритим до появи оновлень (секунди).
+# Таймаут читання для getUpdates має бути більшим, інакше з'єднання обірветься раніше
+TELEGRAM_POLL_TIMEOUT = int(os.getenv('TELEGRAM_POLL_TIMEOUT', '50'))
+TELEGRAM_POLL_READ_TIMEOUT = TELEGRAM_POLL_TIMEOUT + 10
+
+# Скільки оновлень обробляється одночасно і скільки з'єднань до Bot API тримаємо відкритими
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv('TELEGRAM_CONCURRENT_UPDATES', '256'))
+TELEGRAM_CONNECTION_POOL_SIZE = int(os.getenv('TELEGRAM_CONNECTION_POOL_SIZE', '64'))
+TELEGRAM_POOL_TIMEOUT = 10
+
+# Шаблони відповіді з рекомендацією (значення з таблиці екрануються для HTML)
+RESTAURANT_CARD_TEMPLATE = (
+    "<b>{name}</b>\n"
+    "📍 {address}\n"
+    "🏢 Тип: {type}\n"
+    "📱 Соц-мережі: {socials}\n"
+    "✨ Атмосфера: {vibe}\n"
+    "🎯 Підходить для: {aim}"
+)
+
+SINGLE_RECOMMENDATION_TEMPLATE = "🏠 <b>Рекомендую цей заклад:</b>\n\n{card}"
+
+DUAL_RECOMMENDATION_TEMPLATE = (
+    "🎯 <b>2 найкращі варіанти для вас:</b>\n\n"
+    "<b>🏆 ПРІОРИТЕТНА РЕКОМЕНДАЦІЯ:</b>\n"
+    "{priority_card}\n\n"
+    "💡 <i>Чому пріоритет: {explanation}</i>\n\n"
+    "➖➖➖➖➖➖➖➖➖➖\n\n"
+    "<b>🥈 АЛЬТЕРНАТИВНИЙ ВАРІАНТ:</b>\n"
+    "{alternative_card}"
+)
+
+RATING_REQUEST_TEMPLATE = (
+    "⭐ <b>Оціни ПРІОРИТЕТНУ рекомендацію від 1 до 10</b>\n"
+    "(оцінюємо \"{name}\")\n\n"
+    "1 - зовсім не підходить\n"
+    "10 - ідеально підходить\n\n"
+    "Напиши цифру в чаті 👇"
+)
+
+# Привітання для /start (статичне, тому збирається один раз)
+START_MESSAGE = (
+    "🍽 Привіт! Я допоможу тобі знайти ідеальний ресторан!\n\n"
+    "Розкажи мені про своє побажання. Наприклад:\n"
+    "• 'Хочу місце для обіду з сім'єю'\n"
+    "• 'Потрібен ресторан для побачення'\n"
+    "• 'Шукаю піцу з друзями'\n\n"
+    "Напиши, що ти шукаєш! 😊"
+)
+
+async def start(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE'):
     """Обробник команди /start"""
     user_id = update.effective_user.id
-    user_states[user_id] = "waiting_request"
+    # Новий діалог скасовує незавершену оцінку
+    user_sessions.pop(user_id, None)
     
-    message = (
-        "🍽 Привіт! Я допоможу тобі знайти ідеальний ресторан!\n\n"
-        "Розкажи мені про своє побажання. Наприклад:\n"
-        "• 'Хочу місце для обіду з сім'єю'\n"
-        "• 'Потрібен ресторан для побачення'\n"
-        "• 'Шукаю піцу з друзями'\n\n"
-        "Напиши, що ти шукаєш! 😊"
-    )
-    
-    await update.message.reply_text(message)
+    await update.message.reply_text(START_MESSAGE)
     logger.info(f"✅ Користувач {user_id} почав діалог")
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обробник текстових повідомлень"""
-    user_id = update.effective_user.id
-    
-    if user_id not in user_states:
-        await update.message.reply_text("Напишіть /start, щоб почати")
-        return
-    
+async def _handle_explanation(update: 'Update', user_id: int, session: "UserSession"):
+    """Пояснення до щойно поставленої оцінки"""
+    explanation = update.message.text
+
+    if session.rating:
+        restaurant_bot.log_request(
+            user_id, 
+            'Оцінка', 
+            session.last_recommendation or "Невідомий ресторан", 
+            session.rating, 
+            explanation
+        )
+
+        await update.message.reply_text(
+            f"Дякую за детальну оцінку! 🙏\n\n"
+            f"Ваша оцінка: {session.rating}/10\n"
+            f"Пояснення записано в базу даних.\n\n"
+            f"Напишіть новий запит, щоб знайти ще один ресторан!"
+        )
+
+        user_sessions.pop(user_id, None)
+
+        logger.info(f"💬 Користувач {user_id} надав пояснення оцінки: {explanation[:100]}...")
+
+async def _handle_rating(update: 'Update', user_id: int, session: "UserSession"):
+    """Оцінка останньої рекомендації числом від 1 до 10"""
     user_text = update.message.text
-    current_state = user_states[user_id]
-    
-    if current_state == "waiting_explanation":
-        explanation = user_text
-        rating_data = user_rating_data.get(user_id, {})
-        
-        if rating_data:
-            await restaurant_bot.log_request(
-                user_id, 
-                rating_data['user_request'], 
-                rating_data['restaurant_name'], 
-                rating_data['rating'], 
-                explanation
-            )
-            
-            await update.message.reply_text(
-                f"Дякую за детальну оцінку! 🙏\n\n"
-                f"Ваша оцінка: {rating_data['rating']}/10\n"
-                f"Пояснення записано в базу даних.\n\n"
-                f"Напишіть /start, щоб знайти ще один ресторан!"
-            )
-            
-            user_states[user_id] = "completed"
-            if user_id in user_last_recommendation:
-                del user_last_recommendation[user_id]
-            if user_id in user_rating_data:
-                del user_rating_data[user_id]
-            
-            logger.info(f"💬 Користувач {user_id} надав пояснення оцінки: {explanation[:100]}...")
-            return
-    
-    if current_state == "waiting_rating" and user_text.isdigit():
-        rating = int(user_text)
-        if 1 <= rating <= 10:
-            restaurant_name = user_last_recommendation.get(user_id, "Невідомий ресторан")
-            user_rating_data[user_id] = {
-                'rating': rating,
-                'restaurant_name': restaurant_name,
-                'user_request': 'Оцінка'
-            }
-            
-            user_states[user_id] = "waiting_explanation"
-            
+    if not user_text.isdigit():
+        await update.message.reply_text("Будь ласка, оцініть попередню рекомендацію числом від 1 до 10")
+        return
+
+    rating = int(user_text)
+    if not 1 <= rating <= 10:
+        await update.message.reply_text("Будь ласка, напишіть число від 1 до 10")
+        return
+
+    restaurant_name = session.last_recommendation or "Невідомий ресторан"
+    session.rating = rating
+    session.state = "waiting_explanation"
+    # Повторний запис продовжує час життя сесії
+    user_sessions[user_id] = session
+
+    await update.message.reply_text(
+        f"Дякую за оцінку {rating}/10! ⭐\n\n"
+        f"🤔 <b>Чи можеш пояснити чому така оцінка?</b>\n"
+        f"Напиши, що сподобалось або не сподобалось у рекомендації."
+    )
+
+    logger.info(f"⭐ Користувач {user_id} оцінив {restaurant_name} на {rating}/10, очікуємо пояснення")
+
+async def _handle_request(update: 'Update', user_id: int, session: Optional["UserSession"]):
+    """Новий запит: підбір і надсилання рекомендації"""
+    user_request = update.message.text
+    logger.info(f"🔍 Користувач {user_id} написав: {user_request}")
+
+    processing_message = await update.message.reply_text("🔍 Шукаю ідеальний ресторан для вас...")
+
+    recommendation = await restaurant_bot.get_recommendation(user_request)
+
+    # Видаляємо "Шукаю..." паралельно з надсиланням відповіді
+    run_in_background(delete_message_safely(processing_message))
+
+    if recommendation:
+        # Перевіряємо чи це повідомлення про відсутність страви
+        if recommendation.get("dish_not_found"):
             await update.message.reply_text(
-                f"Дякую за оцінку {rating}/10! ⭐\n\n"
-                f"🤔 <b>Чи можеш пояснити чому така оцінка?</b>\n"
-                f"Напиши, що сподобалось або не сподобалось у рекомендації.",
-                parse_mode='HTML'
+                f"😔 {recommendation['message']}\n\n"
+                f"Спробуй знайти щось інше - просто напиши новий запит!"
             )
-            
-            logger.info(f"⭐ Користувач {user_id} оцінив {restaurant_name} на {rating}/10, очікуємо пояснення")
+            logger.info(f"❌ Повідомлено користувачу {user_id} про відсутність страви: {recommendation['missing_dishes']}")
             return
-        else:
-            await update.message.reply_text("Будь ласка, напишіть число від 1 до 10")
-            return
-    
-    if current_state == "waiting_request":
-        user_request = user_text
-        logger.info(f"🔍 Користувач {user_id} написав: {user_request}")
-        
-        processing_message = await update.message.reply_text("🔍 Шукаю ідеальний ресторан для вас...")
-        
-        recommendation = await restaurant_bot.get_recommendation(user_request)
-        
-        try:
-            await processing_message.delete()
-        except:
-            pass
-        
-        if recommendation:
-            # Перевіряємо чи це повідомлення про відсутність страви
-            if recommendation.get("dish_not_found"):
-                await update.message.reply_text(
-                    f"😔 {recommendation['message']}\n\n"
-                    f"Спробуй знайти щось інше або напиши /start для нового пошуку!"
-                )
-                logger.info(f"❌ Повідомлено користувачу {user_id} про відсутність страви: {recommendation['missing_dishes']}")
-                return
-            
-            # Тепер recommendation це словник з кількома ресторанами
-            restaurants = recommendation["restaurants"]
-            priority_index = recommendation["priority_index"]
-            priority_explanation = recommendation["priority_explanation"]
-            
-            # Логуємо основний (пріоритетний) ресторан
-            main_restaurant = restaurants[priority_index]
-            await restaurant_bot.log_request(user_id, user_request, main_restaurant["name"])
-            
-            # Зберігаємо пріоритетний ресторан для оцінки
-            user_last_recommendation[user_id] = main_restaurant["name"]
-            user_states[user_id] = "waiting_rating"
-            
-            # Формуємо повідомлення з двома варіантами
-            if len(restaurants) == 1:
-                # Якщо тільки один варіант
-                response_text = f"""🏠 <b>Рекомендую цей заклад:</b>
-
-<b>{restaurants[0]['name']}</b>
-📍 {restaurants[0]['address']}
-🏢 Тип: {restaurants[0]['type']}
-📱 Соц-мережі: {restaurants[0]['socials']}
-✨ Атмосфера: {restaurants[0]['vibe']}
-🎯 Підходить для: {restaurants[0]['aim']}"""
-            else:
-                # Якщо два варіанти
-                priority_restaurant = restaurants[priority_index]
-                alternative_restaurant = restaurants[1 - priority_index]
-                
-                response_text = f"""🎯 <b>2 найкращі варіанти для вас:</b>
 
-<b>🏆 ПРІОРИТЕТНА РЕКОМЕНДАЦІЯ:</b>
-<b>{priority_restaurant['name']}</b>
-📍 {priority_restaurant['address']}
-🏢 Тип: {priority_restaurant['type']}
-📱 Соц-мережі: {priority_restaurant['socials']}
-✨ Атмосфера: {priority_restaurant['vibe']}
-🎯 Підходить для: {priority_restaurant['aim']}
+        # Тепер recommendation це словник з кількома ресторанами
+        restaurants = recommendation["restaurants"]
+        priority_index = recommendation["priority_index"]
+        priority_explanation = recommendation["priority_explanation"]
 
-💡 <i>Чому пріоритет: {priority_explanation}</i>
+        # Логуємо основний (пріоритетний) ресторан
+        main_restaurant = restaurants[priority_index]
+        restaurant_bot.log_request(user_id, user_request, main_restaurant["name"])
 
-➖➖➖➖➖➖➖➖➖➖
+        # Зберігаємо пріоритетний ресторан для оцінки
+        user_sessions[user_id] = UserSession(state="waiting_rating", last_recommendation=main_restaurant["name"])
 
-<b>🥈 АЛЬТЕРНАТИВНИЙ ВАРІАНТ:</b>
-<b>{alternative_restaurant['name']}</b>
-📍 {alternative_restaurant['address']}
-🏢 Тип: {alternative_restaurant['type']}
-📱 Соц-мережі: {alternative_restaurant['socials']}
-✨ Атмосфера: {alternative_restaurant['vibe']}
-🎯 Підходить для: {alternative_restaurant['aim']}"""
+        # Частини повідомлення збираємо у список і з'єднуємо один раз
+        if len(restaurants) == 1:
+            # Якщо тільки один варіант
+            parts = [SINGLE_RECOMMENDATION_TEMPLATE.format(card=restaurants[0]['card'])]
+        else:
+            # Якщо два варіанти
+            parts = [DUAL_RECOMMENDATION_TEMPLATE.format(
+                priority_card=restaurants[priority_index]['card'],
+                explanation=html.escape(priority_explanation, quote=False),
+                alternative_card=restaurants[1 - priority_index]['card']
+            )]
 
-            # Додаємо посилання на меню для пріоритетного ресторану
-            main_menu_url = main_restaurant.get('menu_url', '')
-            if main_menu_url and main_menu_url.startswith('http'):
-                response_text += f"\n\n📋 <a href='{main_menu_url}'>Переглянути меню пріоритетного варіанту</a>"
+        # Додаємо посилання на меню для пріоритетного ресторану
+        if main_restaurant['menu_ok']:
+            parts.append(f"📋 <a href='{main_restaurant['menu_url']}'>Переглянути меню пріоритетного варіанту</a>")
 
-            # Відправляємо фото пріоритетного ресторану (якщо є)
-            main_photo_url = main_restaurant.get('photo', '')
-            
-            if main_photo_url and main_photo_url.startswith('http'):
-                try:
-                    logger.info(f"📸 Надсилаю фото пріоритетного ресторану: {main_photo_url}")
-                    await update.message.reply_photo(
-                        photo=main_photo_url,
-                        caption=response_text,
-                        parse_mode='HTML'
-                    )
-                    logger.info(f"✅ Надіслано рекомендацію з фото: {main_restaurant['name']}")
-                except Exception as photo_error:
-                    logger.warning(f"⚠️ Не вдалось надіслати фото: {photo_error}")
-                    response_text += f"\n\n📸 <a href='{main_photo_url}'>Переглянути фото пріоритетного ресторану</a>"
-                    await update.message.reply_text(response_text, parse_mode='HTML')
-                    logger.info(f"✅ Надіслано рекомендацію з посиланням на фото: {main_restaurant['name']}")
-            else:
-                await update.message.reply_text(response_text, parse_mode='HTML')
-                logger.info(f"✅ Надіслано текстові рекомендації: {main_restaurant['name']}")
-            
-            # Просимо оцінити ПРІОРИТЕТНИЙ варіант
-            rating_text = f"""⭐ <b>Оціни ПРІОРИТЕТНУ рекомендацію від 1 до 10</b>
-(оцінюємо "{main_restaurant['name']}")
+        # Прохання оцінити ПРІОРИТЕТНИЙ варіант додаємо до самої рекомендації,
+        # щоб не надсилати окреме повідомлення
+        rating_text = RATING_REQUEST_TEMPLATE.format(name=html.escape(str(main_restaurant.get('name', '')), quote=False))
+        response_text = "\n\n".join(parts)
+        full_text = f"{response_text}\n\n{rating_text}"
+        rating_sent = True
 
-1 - зовсім не підходить
-10 - ідеально підходить
+        # Відправляємо фото пріоритетного ресторану (якщо є)
+        main_photo_url = main_restaurant['photo']
 
-Напиши цифру в чаті 👇"""
-            await update.message.reply_text(rating_text, parse_mode='HTML')
-            
+        if main_restaurant['photo_ok']:
+            caption = full_text
+            if len(caption) > PHOTO_CAPTION_LIMIT:
+                # Підпис до фото обмежений, тому прохання оцінити надішлемо окремо
+                caption = response_text
+                rating_sent = False
+            # Вже надіслане фото передаємо за file_id - Telegram не завантажує його з Drive знову
+            photo = restaurant_bot.photo_source(main_photo_url)
+            try:
+                logger.info(f"📸 Надсилаю фото пріоритетного ресторану: {main_photo_url}")
+                sent_message = await update.message.reply_photo(
+                    photo=photo,
+                    caption=caption
+                )
+                restaurant_bot.remember_photo(main_photo_url, sent_message)
+                logger.info(f"✅ Надіслано рекомендацію з фото: {main_restaurant['name']}")
+            except Exception as photo_error:
+                logger.warning(f"⚠️ Не вдалось надіслати фото: {photo_error}")
+                if photo != main_photo_url:
+                    restaurant_bot.forget_photo(main_photo_url)
+                parts.append(f"📸 <a href='{main_photo_url}'>Переглянути фото пріоритетного ресторану</a>")
+                parts.append(rating_text)
+                await update.message.reply_text("\n\n".join(parts))
+                rating_sent = True
+                logger.info(f"✅ Надіслано рекомендацію з посиланням на фото: {main_restaurant['name']}")
         else:
-            await update.message.reply_text("Вибачте, не знайшов закладів з потрібними стравами. Спробуйте змінити запит або вказати конкретну страву.")
-            logger.warning(f"⚠️ Не знайдено рекомендацій для користувача {user_id}")
-    
+            await update.message.reply_text(full_text)
+            logger.info(f"✅ Надіслано текстові рекомендації: {main_restaurant['name']}")
+
+        if not rating_sent:
+            await update.message.reply_text(rating_text)
+
     else:
-        if current_state == "waiting_rating":
-            await update.message.reply_text("Будь ласка, оцініть попередню рекомендацію числом від 1 до 10")
-        elif current_state == "waiting_explanation":
-            pass
-        else:
-            await update.message.reply_text("Напишіть /start, щоб почати знову")
+        await update.message.reply_text("Вибачте, не знайшов закладів з потрібними стравами. Спробуйте змінити запит або вказати конкретну страву.")
+        logger.warning(f"⚠️ Не знайдено рекомендацій для користувача {user_id}")
+
+# Обробник повідомлення для кожного стану діалогу
+MESSAGE_HANDLERS = {
+    "waiting_request": _handle_request,
+    "waiting_rating": _handle_rating,
+    "waiting_explanation": _handle_explanation,
+}
+
+async def handle_message(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE'):
+    """Обробник текстових повідомлень: передає повідомлення обробнику поточного стану діалогу"""
+    user_id = update.effective_user.id
+    # Без збереженого стану кожне повідомлення - це новий запит
+    session = user_sessions.get(user_id)
+    current_state = session.state if session else "waiting_request"
+    await MESSAGE_HANDLERS[current_state](update, user_id, session)
 
-async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def stats_command(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE'):
     """Команда для перегляду статистики"""
     user_id = update.effective_user.id
     
-    admin_ids = [980047923]
-    
-    if user_id not in admin_ids:
+    if user_id not in ADMIN_IDS:
         await update.message.reply_text("У вас немає доступу до статистики")
         return
     
@@ -1717,72 +2514,101 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Статистика недоступна")
             return
         
-        summary_data = restaurant_bot.summary_sheet.get_all_values()
+        stats_text = await restaurant_bot.get_stats_text()
         
-        if len(summary_data) < 6:
+        if stats_text is None:
             await update.message.reply_text("Недостатньо даних для статистики")
             return
         
-        # Додаємо інформацію про покращення
-        enhanced_status = "✅ Увімкнено" if ENHANCED_SEARCH_CONFIG['enabled'] else "❌ Вимкнено"
-        fuzzy_status = "✅ Увімкнено" if (ENHANCED_SEARCH_CONFIG['fuzzy_matching'] and FUZZY_AVAILABLE) else "❌ Вимкнено"
+        await update.message.reply_text(stats_text)
         
-        stats_text = f"""📊 <b>Статистика бота</b>
-
-📈 Загальна кількість запитів: <b>{summary_data[1][1]}</b>
-👥 Кількість унікальних користувачів: <b>{summary_data[2][1]}</b>
-⭐ Середня оцінка відповідності: <b>{summary_data[3][1]}</b>
-📢 Кількість оцінок: <b>{summary_data[4][1]}</b>
-📊 Середня кількість запитів на користувача: <b>{summary_data[5][1]}</b>
-
-🔧 <b>Покращений пошук:</b>
-• Статус: {enhanced_status}
-• Fuzzy matching: {fuzzy_status}
-• Negation detection: {'✅' if ENHANCED_SEARCH_CONFIG['negation_detection'] else '❌'}
-• Regex boundaries: {'✅' if ENHANCED_SEARCH_CONFIG['regex_boundaries'] else '❌'}
-
-🕐 Останнє оновлення: {summary_data[1][2]}"""
-        
-        await update.message.reply_text(stats_text, parse_mode='HTML')
-        
-    except Exception as e:
-        logger.error(f"Помилка отримання статистики: {e}")
+    except Exception:
+        logger.exception("Помилка отримання статистики")
         await update.message.reply_text("Помилка при отриманні статистики")
 
-async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+async def error_handler(update: object, context: 'ContextTypes.DEFAULT_TYPE'):
     """Обробник помилок"""
-    logger.error(f"❌ Помилка: {context.error}")
+    logger.error("❌ Помилка: %s", context.error, exc_info=context.error)
 
-def main():
-    """Основна функція запуску бота"""
-    if not TELEGRAM_BOT_TOKEN:
-        logger.error("❌ TELEGRAM_BOT_TOKEN не встановлений!")
-        return
-        
-    if not OPENAI_API_KEY:
-        logger.error("❌ OPENAI_API_KEY не встановлений!")
-        return
+async def _shutdown_step(name: str, coro):
+    """Крок зупинки: помилка логується, але не перериває закриття решти з'єднань"""
+    try:
+        await coro
+    except Exception:
+        logger.exception("❌ Помилка під час зупинки (%s)", name)
+
+async def main_async():
+    """Запуск бота в єдиному event loop"""
+    from telegram.constants import ParseMode
+    from telegram.ext import AIORateLimiter, Application, CommandHandler, Defaults, MessageHandler, filters
+    from telegram.request import HTTPXRequest
+    
+    class FastJSONRequest(HTTPXRequest):
+        """Відповіді Bot API (зокрема getUpdates) розбираються через _json_loads - orjson, якщо він є"""
+        __slots__ = ()
         
-    if not GOOGLE_SHEET_URL:
-        logger.error("❌ GOOGLE_SHEET_URL не встановлений!")
-        return
+        @staticmethod
+        def parse_json_payload(payload: bytes) -> dict:
+            try:
+                return _json_loads(payload)
+            except ValueError:
+                # Невалідний UTF-8 чи JSON - стандартний розбір PTB з його обробкою помилок
+                return HTTPXRequest.parse_json_payload(payload)
     
-    logger.info("🚀 Запускаю покращений бота...")
+    # Ліміти Telegram: ~30 повідомлень на секунду для бота і 20 на хвилину
+    # в групі - тримаємо невеликий запас. HTML - режим розмітки за замовчуванням.
+    # Оновлення обробляються паралельно: поки одне чекає OpenAI чи Sheets, інші не стоять у черзі
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .rate_limiter(AIORateLimiter(
+            overall_max_rate=TELEGRAM_OVERALL_MAX_RATE,
+            overall_time_period=1,
+            group_max_rate=TELEGRAM_GROUP_MAX_RATE,
+            group_time_period=60,
+            max_retries=TELEGRAM_MAX_RETRIES
+        ))
+        .concurrent_updates(TELEGRAM_CONCURRENT_UPDATES)
+        .request(FastJSONRequest(
+            connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE,
+            pool_timeout=TELEGRAM_POOL_TIMEOUT
+        ))
+        .get_updates_request(FastJSONRequest(read_timeout=TELEGRAM_POLL_READ_TIMEOUT))
+        .defaults(Defaults(parse_mode=ParseMode.HTML))
+        .build()
+    )
+    logger.info("✅ Telegram додаток створено успішно!")
+    
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("stats", stats_command))
+    # Лише нові текстові повідомлення в особистому чаті: редагування, пости каналів і групи
+    # відсіюються фільтром ще до запуску обробника (у них немає update.message або користувача)
+    application.add_handler(MessageHandler(
+        filters.UpdateType.MESSAGE & filters.ChatType.PRIVATE & filters.TEXT & ~filters.COMMAND,
+        handle_message
+    ))
+    application.add_error_handler(error_handler)
     
+    loop = asyncio.get_running_loop()
+    # Усі звернення до Google Sheets йдуть через asyncio.to_thread
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=SHEETS_THREAD_POOL_SIZE))
+    
+    # SIGTERM (так зупиняють контейнер при перезапуску) завершує роботу через finally нижче,
+    # тож черга Analytics дописується, а з'єднання закриваються
+    stop_event = asyncio.Event()
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-        logger.info("✅ Telegram додаток створено успішно!")
-        
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("stats", stats_command))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        application.add_error_handler(error_handler)
-        
-        logger.info("🔗 Підключаюся до Google Sheets...")
-        loop.run_until_complete(restaurant_bot.init_google_sheets())
+        loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+    except (NotImplementedError, RuntimeError):
+        pass
+    
+    restaurant_bot.load_photo_file_ids()
+    await application.initialize()
+    try:
+        logger.info("🔗 Підключаюся до Google Sheets і OpenAI...")
+        await asyncio.gather(
+            restaurant_bot.init_google_sheets(),
+            restaurant_bot.warm_up_openai()
+        )
         
         # Логуємо конфігурацію покращеного пошуку
         logger.info(f"🔧 Конфігурація покращеного пошуку: {ENHANCED_SEARCH_CONFIG}")
@@ -1790,20 +2616,54 @@ def main():
             logger.info("✅ Fuzzy matching доступний")
         else:
             logger.warning("⚠️ Fuzzy matching недоступний - встановіть fuzzywuzzy: pip install fuzzywuzzy")
-        
+        if not GSPREAD_AVAILABLE:
+            logger.warning("⚠️ Google Sheets недоступний - встановіть gspread: pip install gspread")
+        if AHOCORASICK_AVAILABLE:
+            logger.info("✅ Aho-Corasick пошук ключових слів доступний")
+        else:
+            logger.warning("⚠️ Aho-Corasick недоступний, використовую regex - встановіть pyahocorasick: pip install pyahocorasick")
+        
+        await application.start()
+        await application.updater.start_polling(
+            drop_pending_updates=True,
+            poll_interval=0.0,
+            timeout=TELEGRAM_POLL_TIMEOUT
+        )
         logger.info("✅ Всі сервіси підключено! Покращений бот готовий до роботи!")
         
-        loop.run_until_complete(application.run_polling(drop_pending_updates=True))
-        
+        # Працюємо, доки процес не зупинять
+        await stop_event.wait()
+        logger.info("🛑 Отримано сигнал зупинки")
+    finally:
+        # Спочатку зупиняємо отримання й обробку оновлень (stop() дочікується обробників),
+        # і лише потім дописуємо чергу Analytics - інакше нові рядки лишились би в черзі
+        if application.updater.running:
+            await _shutdown_step("updater", application.updater.stop())
+        if application.running:
+            await _shutdown_step("application", application.stop())
+        await _shutdown_step("Analytics", restaurant_bot.flush_analytics())
+        await _shutdown_step("shutdown", application.shutdown())
+        if openai_client is not None:
+            await _shutdown_step("OpenAI", openai_client.close())
+
+def main():
+    """Основна функція запуску бота"""
+    if MISSING_ENV_VARS:
+        logger.error(f"❌ Не встановлені змінні середовища: {', '.join(MISSING_ENV_VARS)}")
+        raise SystemExit(1)
+    
+    logger.info("🚀 Запускаю покращений бота...")
+    
+    if UVLOOP_AVAILABLE:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("✅ uvloop увімкнено")
+    
+    try:
+        asyncio.run(main_async())
     except KeyboardInterrupt:
         logger.info("🛑 Бота зупинено користувачем")
-    except Exception as e:
-        logger.error(f"❌ Критична помилка: {e}")
-    finally:
-        try:
-            loop.close()
-        except:
-            pass
+    except Exception:
+        logger.exception("❌ Критична помилка")
 
 if __name__ == '__main__':
     main()